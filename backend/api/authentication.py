@@ -0,0 +1,51 @@
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+from . import metrics
+
+
+def get_token_cache_key(key):
+    """Ключ кеша для токена; сам токен в кеш не попадает."""
+    return 'auth_token:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+def invalidate_token_cache(*keys):
+    cache.delete_many([get_token_cache_key(key) for key in keys])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Аутентификация по токену с кешированием владельца токена.
+    В кеше AUTH_TOKEN_CACHE_TIMEOUT секунд хранятся только id и
+    is_active пользователя. При попадании возвращается пользователь
+    с отложенными остальными полями: запросы, которым нужен лишь id,
+    обходятся без обращения к базе, остальные поля загружаются одним
+    запросом при первом обращении.
+    Запись сбрасывается при удалении токена и сохранении пользователя.
+    Чтобы сброс доходил до всех процессов, нужен общий кеш
+    (CACHE_BACKEND); с LocMemCache деактивация пользователя
+    вступает в силу в других процессах через время жизни записи.
+    """
+    def authenticate_credentials(self, key):
+        cache_key = get_token_cache_key(key)
+        cached = cache.get(cache_key)
+        if cached is None:
+            metrics.increment('auth_token_cache', result='miss')
+            user, token = super().authenticate_credentials(key)
+            cache.set(cache_key, (user.pk, user.is_active),
+                      settings.AUTH_TOKEN_CACHE_TIMEOUT)
+            return user, token
+        metrics.increment('auth_token_cache', result='hit')
+        user_id, is_active = cached
+        if not is_active:
+            raise AuthenticationFailed('User inactive or deleted.')
+        user = get_user_model().from_db(
+            None, ('id', 'is_active'), (user_id, is_active))
+        token = Token(key=key, user_id=user_id)
+        token.user = user
+        return user, token
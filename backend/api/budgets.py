@@ -0,0 +1,75 @@
+import logging
+import random
+
+from django.conf import settings
+
+from . import metrics
+from .queries import record_queries
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    """Представление сделало больше запросов к базе, чем заявлено."""
+
+
+def query_budget(budget):
+    """Декоратор для функций-обработчиков: бюджет запросов к базе.
+    У вьюсетов бюджеты задаются атрибутом query_budgets по действиям.
+    """
+    def decorator(view):
+        view.query_budget = budget
+        return view
+    return decorator
+
+
+def get_query_budget(view_func, method):
+    """Бюджет для вызываемого представления или None, если не задан."""
+    budget = getattr(view_func, 'query_budget', None)
+    if budget is not None:
+        return budget
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return None
+    # Методы вроде delete, объявленные во вьюсете напрямую,
+    # не попадают в actions и ищутся по имени метода.
+    actions = getattr(view_func, 'actions', None) or {}
+    action = actions.get(method.lower(), method.lower())
+    return getattr(view_class, 'query_budgets', {}).get(action)
+
+
+class QueryBudgetMiddleware:
+    """Проверяет бюджеты запросов к базе у представлений API.
+    В режиме QUERY_BUDGET_STRICT превышение вызывает исключение,
+    иначе отпечатки запросов пишутся в лог с долей
+    QUERY_BUDGET_LOG_SAMPLE_RATE. Запросы, сделанные при отдаче
+    потокового ответа, не учитываются.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with record_queries() as recorder:
+            response = self.get_response(request)
+        budget = getattr(request, 'query_budget', None)
+        if budget is not None and recorder.count > budget:
+            self.report(request, budget, recorder)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = get_query_budget(view_func, request.method)
+
+    def report(self, request, budget, recorder):
+        view_name = request.resolver_match.view_name
+        metrics.increment('query_budget_exceeded', view=view_name)
+        message = (f'{request.method} {view_name}: {recorder.count} '
+                   f'запросов к базе при бюджете {budget}')
+        if settings.QUERY_BUDGET_STRICT:
+            raise QueryBudgetExceeded(message)
+        if random.random() >= settings.QUERY_BUDGET_LOG_SAMPLE_RATE:
+            return
+        fingerprints, _ = recorder.group_by_fingerprint()
+        logger.warning(
+            '%s\n%s', message,
+            '\n'.join(f'{count:4}  {fingerprint}'
+                      for fingerprint, count in fingerprints.most_common()))
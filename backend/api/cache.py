@@ -0,0 +1,146 @@
+import gzip
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, router, transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import parse_etags
+
+DATA_VERSION_SQL = '''
+SELECT md5(COALESCE(string_agg(t::text, ',' ORDER BY t.{pk}), ''))
+FROM {table} AS t
+'''
+
+
+def get_data_version_key(model):
+    return f'data_version:{model._meta.label_lower}'
+
+
+def compute_data_version(model):
+    """Хеш содержимого таблицы модели: одинаков во всех процессах
+    и меняется при любом изменении строк.
+    """
+    sql = DATA_VERSION_SQL.format(
+        pk=model._meta.pk.column, table=model._meta.db_table)
+    with connections[router.db_for_read(model)].cursor() as cursor:
+        cursor.execute(sql)
+        return cursor.fetchone()[0]
+
+
+def get_data_version(model):
+    """Версия данных модели; хранится в кеше и пересчитывается
+    по таблице после сброса или истечения срока.
+    """
+    key = get_data_version_key(model)
+    version = cache.get(key)
+    if version is None:
+        version = compute_data_version(model)
+        cache.set(key, version, settings.REFERENCE_DATA_CACHE_TIMEOUT)
+    return version
+
+
+def invalidate_data_version(model):
+    """Сбрасывает версию данных модели после фиксации транзакции,
+    чтобы она не была пересчитана по еще старым данным.
+    """
+    key = get_data_version_key(model)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def accepts_gzip(request):
+    """Проверяет, что клиент принимает gzip, с учетом q-значений
+    заголовка Accept-Encoding: gzip;q=0 означает отказ.
+    """
+    codings = {}
+    header = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    for item in header.split(','):
+        coding, *params = item.split(';')
+        quality = 1.0
+        for param in params:
+            name, _, value = param.strip().partition('=')
+            if name.lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        codings[coding.strip().lower()] = quality
+    return codings.get('gzip', codings.get('*', 0.0)) > 0
+
+
+def get_matching_etag(request, etags):
+    """ETag из If-None-Match, совпадающий с одним из вариантов
+    представления, или None.
+    """
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return None
+    for tag in parse_etags(header):
+        if tag == '*':
+            return tag
+        tag = tag[2:] if tag.startswith('W/') else tag
+        if tag in etags:
+            return tag
+    return None
+
+
+class ConditionalCacheMixin:
+    """Условные GET-запросы и кеш готовых ответов для справочников.
+    ETag выводится из версии данных модели, поэтому, пока версия
+    в кеше, ответ 304 не требует обращения к базе. Отрендеренный JSON
+    хранится в кеше вместе со сжатой gzip копией; у сжатого варианта
+    свой ETag с суффиксом -gz.
+    """
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            request, super().retrieve, *args, **kwargs)
+
+    def get_cached_response(self, request, handler, *args, **kwargs):
+        renderer = request.accepted_renderer
+        if renderer.format != 'json':
+            return handler(request, *args, **kwargs)
+        version = get_data_version(self.queryset.model)
+        digest = hashlib.sha256(
+            f'{version}:{request.get_full_path()}'.encode()
+        ).hexdigest()
+        use_gzip = accepts_gzip(request)
+        etags = (f'"{digest}"', f'"{digest}-gz"')
+        etag = etags[use_gzip]
+        headers = {
+            'ETag': etag,
+            'Cache-Control': 'public, no-cache',
+        }
+        if get_conditional_response(
+                request, etag=get_matching_etag(request, etags) or etag):
+            response = HttpResponseNotModified()
+        else:
+            key = f'rendered:{digest}'
+            cached = cache.get(key)
+            if cached is None:
+                content = renderer.render(
+                    handler(request, *args, **kwargs).data,
+                    request.accepted_media_type,
+                    self.get_renderer_context()
+                )
+                cached = (content, gzip.compress(content))
+                cache.set(key, cached, settings.REFERENCE_DATA_CACHE_TIMEOUT)
+            content, compressed = cached
+            content_type = renderer.media_type
+            if renderer.charset:
+                content_type += f'; charset={renderer.charset}'
+            response = HttpResponse(content_type=content_type)
+            if use_gzip:
+                response.content = compressed
+                response['Content-Encoding'] = 'gzip'
+            else:
+                response.content = content
+            response['Content-Length'] = len(response.content)
+        for header, value in headers.items():
+            response[header] = value
+        patch_vary_headers(response, ('Accept', 'Accept-Encoding'))
+        return response
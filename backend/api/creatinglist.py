@@ -1,35 +1,95 @@
-from django.http import HttpResponse
-from recipes.models import ShoppingList
+import csv
+import json
+
+from django.http import StreamingHttpResponse
+from recipes.models import ShoppingCartTotal
+from rest_framework import serializers
+from rest_framework.negotiation import DefaultContentNegotiation
+
+
+class Echo:
+    """Псевдо-буфер для csv.writer: возвращает записанную строку."""
+    def write(self, value):
+        return value
+
+
+class IgnoreFormatContentNegotiation(DefaultContentNegotiation):
+    """Согласование контента без учета параметра format.
+    В выгрузке списка покупок format выбирает формат файла,
+    а не рендерер DRF.
+    """
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return (renderers[0], renderers[0].media_type)
+
+
+def get_shopping_cart_totals(user):
+    """Суммы ингредиентов из списка покупок.
+    Читаются из поддерживаемой инкрементально таблицы ShoppingCartTotal.
+    """
+    return ShoppingCartTotal.objects.filter(
+        user=user, amount__gt=0
+    ).values(
+        'ingredient__name',
+        'ingredient__measurement_unit',
+        'amount'
+    ).order_by('ingredient__name')
+
+
+def render_txt(items):
+    for item in items:
+        yield (f'{item["ingredient__name"]} '
+               f'({item["ingredient__measurement_unit"]}) '
+               f'- {item["amount"]}\n')
+
+
+def render_csv(items):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for item in items:
+        yield writer.writerow((
+            item['ingredient__name'],
+            item['ingredient__measurement_unit'],
+            item['amount']
+        ))
+
+
+def render_json(items):
+    yield '['
+    separator = ''
+    for item in items:
+        yield separator + json.dumps({
+            'name': item['ingredient__name'],
+            'measurement_unit': item['ingredient__measurement_unit'],
+            'amount': item['amount']
+        }, ensure_ascii=False)
+        separator = ','
+    yield ']'
+
+
+SHOPPING_CART_FORMATS = {
+    'txt': (render_txt, 'text/plain; charset=utf-8'),
+    'csv': (render_csv, 'text/csv; charset=utf-8'),
+    'json': (render_json, 'application/json; charset=utf-8'),
+}
 
 
 def collect_shopping_cart(request):
     """ Создание списка покупок.
-    Позволяет пользователям получать список покупок в виде TXT файла,
-    где все ингредиенты будут суммированы.
+    Позволяет пользователям получать список покупок в виде TXT, CSV
+    или JSON файла (параметр format), где все ингредиенты будут
+    суммированы. Файл отдается потоком по мере чтения из базы.
     """
-    shopping_cart = ShoppingList.objects.filter(user=request.user).all()
-    shopping_list = {}
-    for item in shopping_cart:
-        for recipe_ingredient in item.recipe.ingredient_in_recipe.all():
-            name = recipe_ingredient.ingredient.name
-            measuring_unit = recipe_ingredient.ingredient.measurement_unit
-            amount = recipe_ingredient.amount
-            if name not in shopping_list:
-                shopping_list[name] = {
-                    'name': name,
-                    'measurement_unit': measuring_unit,
-                    'amount': amount
-                }
-            else:
-                shopping_list[name]['amount'] += amount
-    content = (
-        [f'{item["name"]} ({item["measurement_unit"]}) '
-         f'- {item["amount"]}\n'
-         for item in shopping_list.values()]
-    )
-    filename = 'shopping_list.txt'
-    response = HttpResponse(content, content_type='text/plain; charset=utf-8')
+    file_format = request.query_params.get('format', 'txt')
+    if file_format not in SHOPPING_CART_FORMATS:
+        raise serializers.ValidationError({
+            'format': 'Доступные форматы: '
+                      f'{", ".join(SHOPPING_CART_FORMATS)}.'
+        })
+    render, content_type = SHOPPING_CART_FORMATS[file_format]
+    items = get_shopping_cart_totals(request.user).iterator()
+    filename = f'shopping_list.{file_format}'
+    response = StreamingHttpResponse(render(items), content_type=content_type)
     response['Content-Disposition'] = (
-        f'attachment; filename={0}'.format(filename)
+        f'attachment; filename="{filename}"'
     )
     return response
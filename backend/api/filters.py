@@ -1,5 +1,7 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import F
 from django_filters import rest_framework as filters
-from recipes.models import Recipe
+from recipes.models import SEARCH_CONFIG, Recipe
 from rest_framework.filters import SearchFilter
 
 
@@ -27,15 +29,24 @@ class RecipeFilter(filters.FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         field_name='is_in_shopping_cart',
         method='get_filter_is_in_shopping_cart')
+    search = filters.CharFilter(method='get_filter_search')
 
     def get_filter_is_favorited(self, queryset, name, value):
         """Фильтр для избранного"""
         if value and self.request.user.is_authenticated:
-            return queryset.filter(favorites__user=self.request.user)
+            return queryset.filter(is_favorited=True)
         return queryset
 
     def get_filter_is_in_shopping_cart(self, queryset, name, value):
         """Фильтр для списка покупок"""
         if value and self.request.user.is_authenticated:
-            return queryset.filter(shopping_cart__user=self.request.user)
+            return queryset.filter(is_in_shopping_cart=True)
         return queryset
+
+    def get_filter_search(self, queryset, name, value):
+        """Полнотекстовый поиск по названию, описанию и ингредиентам"""
+        query = SearchQuery(
+            value, config=SEARCH_CONFIG, search_type='websearch')
+        return queryset.filter(search_vector=query).annotate(
+            rank=SearchRank(F('search_vector'), query)
+        ).order_by('-rank', '-pub_date')
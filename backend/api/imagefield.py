@@ -1,16 +1,106 @@
 import base64
+import binascii
+from tempfile import SpooledTemporaryFile
 
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from PIL import Image
+from recipes.images import get_image_variant_url
 from rest_framework import serializers
 
+from . import metrics
+
+# Длина кратна 4, чтобы каждый кусок base64 декодировался отдельно.
+CHUNK_SIZE = 64 * 1024
+
 
 class Base64ImageField(serializers.ImageField):
     """
     Декодирование изображения.
+    Строка base64 декодируется по частям во временный файл, который
+    остается в памяти, пока не превысит IMAGE_SPOOL_MAX_MEMORY.
+    Слишком большие данные отклоняются до декодирования.
     """
+    default_error_messages = {
+        'invalid_base64': 'Некорректные данные изображения.',
+        'too_large': 'Размер изображения не должен превышать '
+                     '{max_size} байт.',
+        'too_big_dimensions': 'Стороны изображения не должны превышать '
+                              '{max_side} пикселей.',
+    }
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            image = self.decode(data)
+            self.validate_image(image)
+            return serializers.FileField.to_internal_value(self, image)
         return super().to_internal_value(data)
+
+    def decode(self, data):
+        format, _, imgstr = data.partition(';base64,')
+        ext = format.split('/')[-1]
+        max_size = settings.MAX_IMAGE_UPLOAD_SIZE
+        if len(imgstr) * 3 // 4 - imgstr[-2:].count('=') > max_size:
+            metrics.increment('image_upload_rejected', reason='size')
+            self.fail('too_large', max_size=max_size)
+        file = SpooledTemporaryFile(
+            max_size=settings.IMAGE_SPOOL_MAX_MEMORY)
+        try:
+            for start in range(0, len(imgstr), CHUNK_SIZE):
+                file.write(base64.b64decode(
+                    imgstr[start:start + CHUNK_SIZE], validate=True))
+                if file.tell() > max_size:
+                    metrics.increment('image_upload_rejected', reason='size')
+                    self.fail('too_large', max_size=max_size)
+        except binascii.Error:
+            file.close()
+            self.fail('invalid_base64')
+        except serializers.ValidationError:
+            file.close()
+            raise
+        size = file.tell()
+        metrics.observe(
+            'image_upload_decoded_bytes', size, buckets=metrics.SIZE_BUCKETS)
+        file.seek(0)
+        return UploadedFile(
+            file, name='temp.' + ext, content_type=format[len('data:'):],
+            size=size)
+
+    def validate_image(self, image):
+        """Проверка изображения Pillow без копирования в память.
+        Возвращает формат изображения.
+        """
+        max_side = settings.MAX_IMAGE_SIDE
+        try:
+            with Image.open(image) as pil_image:
+                if max(pil_image.size) > max_side:
+                    metrics.increment(
+                        'image_upload_rejected', reason='dimensions')
+                    self.fail('too_big_dimensions', max_side=max_side)
+                pil_image.verify()
+                return pil_image.format
+        except (OSError, SyntaxError, ValueError,
+                Image.DecompressionBombError):
+            self.fail('invalid_image')
+        finally:
+            image.seek(0)
+
+
+class ImageVariantField(serializers.ImageField):
+    """
+    Вывод уменьшенной копии изображения.
+    Пока копия не создана, отдается исходное изображение.
+    """
+    def __init__(self, variant, **kwargs):
+        self.variant = variant
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        url = get_image_variant_url(value, self.variant)
+        request = self.context.get('request', None)
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
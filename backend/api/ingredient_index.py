@@ -0,0 +1,71 @@
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from recipes.models import Ingredient
+
+from .cache import get_data_version
+
+
+class IngredientIndex:
+    """Индекс названий ингредиентов в памяти процесса.
+    Строится при первом обращении из отсортированного списка названий
+    в нижнем регистре и сбрасывается сигналами модели Ingredient.
+    Индекс перестраивается и при смене версии данных в кеше, а время
+    его жизни ограничено, чтобы изменения, сделанные в других
+    процессах, тоже доходили до индекса.
+    """
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._index = None
+        self._version = None
+        self._built_at = 0.0
+
+    def invalidate(self):
+        """Сбрасывает индекс, он будет перестроен при следующем запросе."""
+        with self._lock:
+            self._index = None
+
+    def _is_stale(self, version):
+        return (self._index is None
+                or self._version != version
+                or time.monotonic() - self._built_at > self.ttl)
+
+    def _get_index(self):
+        version = get_data_version(Ingredient)
+        if self._is_stale(version):
+            with self._lock:
+                if self._is_stale(version):
+                    entries = sorted(
+                        (name.lower(), pk, name, measurement_unit)
+                        for pk, name, measurement_unit
+                        in Ingredient.objects.values_list(
+                            'id', 'name', 'measurement_unit')
+                    )
+                    self._index = ([entry[0] for entry in entries], entries)
+                    self._version = version
+                    self._built_at = time.monotonic()
+        return self._index
+
+    def search(self, query):
+        """Ингредиенты, в названии которых есть query.
+        Сначала идут совпадения по началу названия, затем остальные.
+        """
+        query = query.strip().lower()
+        keys, entries = self._get_index()
+        start = end = bisect_left(keys, query)
+        while end < len(keys) and keys[end].startswith(query):
+            end += 1
+        matches = entries[start:end] + [
+            entry for entry in entries[:start] + entries[end:]
+            if query in entry[0]
+        ]
+        return [
+            {'id': pk, 'name': name, 'measurement_unit': measurement_unit}
+            for _, pk, name, measurement_unit in matches
+        ]
+
+
+ingredient_index = IngredientIndex(ttl=settings.INGREDIENT_INDEX_TTL)
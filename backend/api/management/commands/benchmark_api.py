@@ -0,0 +1,352 @@
+import base64
+import io
+import json
+import math
+import statistics
+import time
+import uuid
+
+from api.queries import record_queries
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from PIL import Image
+from recipes.counters import change_counter
+from recipes.images import delete_image, wait_for_image_variants
+from recipes.models import ImageUpload, Ingredient, Recipe, Tag
+from rest_framework.authtoken.models import Token
+
+User = get_user_model()
+
+PASSWORD = 'benchmark-password'
+STAFF_USERNAME = 'benchmark-staff'
+LOGOUT_USERNAME = 'benchmark-logout'
+
+
+def percentile(values, fraction):
+    """Процентиль методом ближайшего ранга."""
+    values = sorted(values)
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+def get_image():
+    buffer = io.BytesIO()
+    Image.new('RGB', (600, 400), '#49B64E').save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+class Command(BaseCommand):
+    help = ('Замеряет задержку, число запросов к базе и размер ответа '
+            'для каждого эндпоинта API')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='Сколько раз вызывать каждый эндпоинт.'
+        )
+        parser.add_argument(
+            '--warmup', type=int, default=2,
+            help='Сколько прогонов не учитывать в результатах.'
+        )
+        parser.add_argument(
+            '--username',
+            help='Пользователь, от имени которого идут запросы. '
+                 'По умолчанию - пользователь с самым большим избранным.'
+        )
+        parser.add_argument(
+            '--only',
+            help='Замерять только эндпоинты, в имени которых есть строка.'
+        )
+        parser.add_argument(
+            '--output',
+            help='Файл для результатов в JSON, по умолчанию stdout.'
+        )
+        parser.add_argument(
+            '--compare',
+            help='JSON предыдущего запуска для сравнения.'
+        )
+
+    def handle(self, *args, **options):
+        """Шаги выполняются в режиме autocommit, как в обычной работе
+        сервиса. Созданные замером пользователи, токены, загрузки
+        и файлы удаляются в конце, даже если замер прерван.
+        """
+        user = self.get_user(options['username'])
+        self.run_id = uuid.uuid4().hex[:8]
+        self.cleanup = {'users': [], 'tokens': [], 'uploads': [],
+                        'recipes': [], 'images': set()}
+        try:
+            steps = self.get_steps(user)
+            if options['only']:
+                steps = [step for step in steps
+                         if options['only'] in step[0]]
+            results = self.run(user, steps, options)
+        finally:
+            self.clean_up()
+        report = {
+            'meta': {
+                'repeat': options['repeat'],
+                'warmup': options['warmup'],
+                'recipes': Recipe.objects.count(),
+                'users': User.objects.count(),
+                'database': connection.vendor,
+            },
+            'endpoints': results,
+        }
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output)
+        else:
+            self.stdout.write(output)
+        if options['compare']:
+            self.compare(options['compare'], results)
+
+    def get_user(self, username):
+        if username:
+            user = User.objects.filter(username=username).first()
+        else:
+            user = User.objects.annotate(
+                favorites_total=Count('favorites')
+            ).order_by('-favorites_total', 'id').first()
+        if user is None or not Recipe.objects.exists():
+            raise CommandError(
+                'Нет данных для замеров, запустите generate_fake_data.')
+        return user
+
+    def create_helper_user(self, username, **extra):
+        """Служебный пользователь; удаляется после замера."""
+        username = f'{username}-{self.run_id}'
+        user = User.objects.create_user(
+            username=username, email=f'{username}@example.com',
+            password=PASSWORD, first_name='Замер', last_name='Замер',
+            **extra)
+        self.cleanup['users'].append(user.id)
+        return user
+
+    def clean_up(self):
+        """Удаляет данные и файлы, созданные замером."""
+        Token.objects.filter(key__in=self.cleanup['tokens']).delete()
+        for upload in ImageUpload.objects.filter(
+                token__in=self.cleanup['uploads']):
+            upload.discard()
+        recipes = Recipe.objects.filter(id__in=self.cleanup['recipes'])
+        for recipe in recipes:
+            recipe.delete()
+            change_counter(User, recipe.author_id, 'recipes_count', -1)
+        User.objects.filter(id__in=self.cleanup['users']).delete()
+        wait_for_image_variants()
+        for name in self.cleanup['images']:
+            if not Recipe.objects.filter(image=name).exists():
+                delete_image(name)
+
+    def get_steps(self, user):
+        """Шаги одного прогона: имя, клиент, метод, путь, тело
+        и необязательные заголовки. В пути, строковых полях тела
+        и заголовках подставляются значения из предыдущих шагов,
+        метка запуска {run} и номер прогона {iteration}. Пары
+        из создания и удаления оставляют данные неизменными.
+        Пароль меняет и входит служебный пользователь, а не
+        пользователь замера.
+        """
+        logout_user = self.create_helper_user(LOGOUT_USERNAME)
+        recipe = Recipe.objects.order_by('-favorites_count', 'id').first()
+        free_recipe = Recipe.objects.exclude(
+            favorites__user=user).exclude(shopping_cart__user=user).first()
+        author = recipe.author
+        free_author = User.objects.exclude(id=user.id).exclude(
+            subscribing__user=user).first()
+        tag = Tag.objects.first()
+        ingredients = list(Ingredient.objects.order_by('id')[:3])
+        image = get_image()
+        recipe_body = {
+            'name': 'Замер',
+            'text': 'Рецепт для замера',
+            'cooking_time': 10,
+            'tags': [tag.id],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': 10}
+                for ingredient in ingredients
+            ],
+        }
+        return [
+            ('tags:list', 'anon', 'get', '/api/tags/', None),
+            ('tags:detail', 'anon', 'get', f'/api/tags/{tag.id}/', None),
+            ('ingredients:list', 'anon', 'get', '/api/ingredients/', None),
+            ('ingredients:search', 'anon', 'get',
+             f'/api/ingredients/?name={ingredients[0].name[:3]}', None),
+            ('ingredients:detail', 'anon', 'get',
+             f'/api/ingredients/{ingredients[0].id}/', None),
+            ('recipes:list:anon', 'anon', 'get', '/api/recipes/', None),
+            ('recipes:list', 'auth', 'get', '/api/recipes/', None),
+            ('recipes:list:cursor', 'auth', 'get',
+             '/api/recipes/?pagination=cursor', None),
+            ('recipes:list:tags', 'auth', 'get',
+             f'/api/recipes/?tags={tag.slug}', None),
+            ('recipes:list:author', 'auth', 'get',
+             f'/api/recipes/?author={author.id}', None),
+            ('recipes:list:favorited', 'auth', 'get',
+             '/api/recipes/?is_favorited=1', None),
+            ('recipes:list:shopping_cart', 'auth', 'get',
+             '/api/recipes/?is_in_shopping_cart=1', None),
+            ('recipes:list:search', 'auth', 'get',
+             f'/api/recipes/?search={recipe.name.split()[0]}', None),
+            ('recipes:detail', 'auth', 'get',
+             f'/api/recipes/{recipe.id}/', None),
+            ('recipes:create', 'auth', 'post', '/api/recipes/', {
+                **recipe_body,
+                'image': 'data:image/jpeg;base64,'
+                         + base64.b64encode(image).decode(),
+            }),
+            ('recipes:update', 'auth', 'patch',
+             '/api/recipes/{created}/', recipe_body),
+            ('recipes:delete', 'auth', 'delete',
+             '/api/recipes/{created}/', None),
+            ('favorite:create', 'auth', 'post',
+             f'/api/recipes/{free_recipe.id}/favorite/', None),
+            ('favorite:delete', 'auth', 'delete',
+             f'/api/recipes/{free_recipe.id}/favorite/', None),
+            ('shopping_cart:create', 'auth', 'post',
+             f'/api/recipes/{free_recipe.id}/shopping_cart/', None),
+            ('shopping_cart:delete', 'auth', 'delete',
+             f'/api/recipes/{free_recipe.id}/shopping_cart/', None),
+            ('shopping_cart:download', 'auth', 'get',
+             '/api/recipes/download_shopping_cart/', None),
+            ('users:create', 'anon', 'post', '/api/users/', {
+                'username': 'benchmark-{run}-{iteration}',
+                'email': 'benchmark-{run}-{iteration}@example.com',
+                'first_name': 'Замер',
+                'last_name': 'Замер',
+                'password': PASSWORD,
+            }),
+            ('users:list', 'auth', 'get', '/api/users/', None),
+            ('users:detail', 'auth', 'get',
+             f'/api/users/{author.id}/', None),
+            ('users:me', 'auth', 'get', '/api/users/me/', None),
+            ('users:subscriptions', 'auth', 'get',
+             '/api/users/subscriptions/?recipes_limit=3', None),
+            ('subscribe:create', 'auth', 'post',
+             f'/api/users/{free_author.id}/subscribe/', None),
+            ('subscribe:delete', 'auth', 'delete',
+             f'/api/users/{free_author.id}/subscribe/', None),
+            ('uploads:create', 'auth', 'post', '/api/uploads/', image),
+            ('uploads:start', 'auth', 'post', '/api/uploads/', b'',
+             {'HTTP_UPLOAD_LENGTH': str(len(image))}),
+            ('uploads:append', 'auth', 'patch', '/api/uploads/{upload}/',
+             image, {'HTTP_UPLOAD_OFFSET': '0'}),
+            ('uploads:detail', 'auth', 'get', '/api/uploads/{upload}/',
+             None),
+            ('users:set_password', 'staff', 'post',
+             '/api/users/set_password/',
+             {'current_password': PASSWORD, 'new_password': PASSWORD}),
+            ('auth:login', 'anon', 'post', '/api/auth/token/login/',
+             {'email': logout_user.email, 'password': PASSWORD}),
+            ('auth:logout', 'anon', 'post', '/api/auth/token/logout/', None,
+             {'HTTP_AUTHORIZATION': 'Token {logout_token}'}),
+            ('metrics', 'staff', 'get', '/api/metrics/', None),
+        ]
+
+    def request(self, client, method, path, body, headers):
+        if isinstance(body, bytes):
+            return getattr(client, method)(
+                path, body, content_type='application/octet-stream',
+                **headers)
+        if body is None:
+            return getattr(client, method)(path, **headers)
+        return getattr(client, method)(
+            path, json.dumps(body), content_type='application/json',
+            **headers)
+
+    def run(self, user, steps, options):
+        token, created = Token.objects.get_or_create(user=user)
+        if created:
+            self.cleanup['tokens'].append(token.key)
+        staff_token = Token.objects.create(
+            user=self.create_helper_user(STAFF_USERNAME, is_staff=True))
+        clients = {
+            'anon': Client(),
+            'auth': Client(HTTP_AUTHORIZATION=f'Token {token.key}'),
+            'staff': Client(HTTP_AUTHORIZATION=f'Token {staff_token.key}'),
+        }
+        state = {'run': self.run_id}
+        samples = {name: [] for name, *_ in steps}
+        details = {}
+        for iteration in range(options['warmup'] + options['repeat']):
+            state['iteration'] = iteration
+            for name, client, method, path, body, *headers in steps:
+                path = path.format(**state)
+                if isinstance(body, dict):
+                    body = {
+                        key: value.format(**state)
+                        if isinstance(value, str) else value
+                        for key, value in body.items()
+                    }
+                headers = {
+                    header: value.format(**state)
+                    for header, value in dict(*headers).items()
+                }
+                with record_queries() as queries:
+                    started = time.perf_counter()
+                    response = self.request(
+                        clients[client], method, path, body, headers)
+                    content = (b''.join(response.streaming_content)
+                               if response.streaming
+                               else response.content)
+                    elapsed = time.perf_counter() - started
+                self.remember(name, method, response)
+                if name == 'recipes:create' and response.status_code == 201:
+                    state['created'] = response.json()['id']
+                if name == 'uploads:start' and response.status_code == 201:
+                    state['upload'] = response.json()['token']
+                if name == 'auth:login':
+                    state['logout_token'] = response.json()['auth_token']
+                if iteration < options['warmup']:
+                    continue
+                samples[name].append(elapsed * 1000)
+                details[name] = {
+                    'method': method.upper(),
+                    'path': path,
+                    'status': response.status_code,
+                    'queries': queries.count,
+                    'bytes': len(content),
+                }
+        return {
+            name: {
+                **details[name],
+                'p50_ms': round(percentile(values, 0.5), 3),
+                'p95_ms': round(percentile(values, 0.95), 3),
+                'mean_ms': round(statistics.mean(values), 3),
+            }
+            for name, values in samples.items() if values
+        }
+
+    def remember(self, name, method, response):
+        """Запоминает созданные шагом объекты для удаления."""
+        if method != 'post' or response.status_code != 201:
+            return
+        data = response.json()
+        if name == 'recipes:create':
+            self.cleanup['recipes'].append(data['id'])
+            self.cleanup['images'].add(Recipe.objects.filter(
+                id=data['id']).values_list('image', flat=True).get())
+        elif name == 'users:create':
+            self.cleanup['users'].append(data['id'])
+        elif name.startswith('uploads:'):
+            self.cleanup['uploads'].append(data['token'])
+
+    def compare(self, path, results):
+        with open(path, encoding='utf-8') as file:
+            baseline = json.load(file)['endpoints']
+        for name, result in results.items():
+            before = baseline.get(name)
+            if before is None:
+                continue
+            change = (result['p50_ms'] - before['p50_ms']) / before['p50_ms']
+            self.stderr.write(
+                f'{name:32} p50 {before["p50_ms"]:9.2f} -> '
+                f'{result["p50_ms"]:9.2f} ms ({change:+.0%}), '
+                f'запросов {before["queries"]} -> {result["queries"]}, '
+                f'байт {before["bytes"]} -> {result["bytes"]}'
+            )
@@ -0,0 +1,17 @@
+from api.profiling import PROFILE_MODES, PROFILE_PARAM, sign_profile_mode
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Выдает подписанное значение параметра _profile'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'mode',
+            choices=PROFILE_MODES,
+            help='cpu - cProfile и стеки, alloc - выделения памяти.'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f'{PROFILE_PARAM}={sign_profile_mode(options["mode"])}')
@@ -0,0 +1,112 @@
+import math
+import threading
+from collections import defaultdict, deque
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = tuple(2 ** power for power in range(10, 26, 2))
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+# Сколько последних запросов каждого представления помнить для сэмплера.
+RECENT_WINDOW = 100
+
+_lock = threading.Lock()
+_counters = defaultdict(float)
+_histograms = {}
+_recent = defaultdict(lambda: deque(maxlen=RECENT_WINDOW))
+
+
+class Histogram:
+    """Гистограмма с накопительными корзинами, как в Prometheus."""
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+
+
+def _get_key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def increment(name, value=1, **labels):
+    """Увеличивает счетчик name с метками labels."""
+    with _lock:
+        _counters[_get_key(name, labels)] += value
+
+
+def observe(name, value, buckets=DEFAULT_BUCKETS, **labels):
+    """Добавляет значение в гистограмму name с метками labels."""
+    key = _get_key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram(buckets)
+        histogram.observe(value)
+
+
+def record_request(view_name, duration, failed):
+    """Запоминает длительность и исход последних запросов представления."""
+    with _lock:
+        _recent[view_name].append((duration, failed))
+
+
+def get_recent_stats(view_name):
+    """95-й процентиль длительности и доля ошибок последних запросов.
+    Возвращает None, если запросов еще не было.
+    """
+    with _lock:
+        recent = list(_recent.get(view_name, ()))
+    if not recent:
+        return None
+    durations = sorted(duration for duration, _ in recent)
+    p95 = durations[max(0, math.ceil(0.95 * len(durations)) - 1)]
+    errors = sum(1 for _, failed in recent if failed)
+    return p95, errors / len(recent)
+
+
+def _escape(value):
+    return (str(value).replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(
+        f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+def render_prometheus():
+    """Все счетчики и гистограммы в текстовом формате Prometheus."""
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted(
+            (key, (histogram.buckets, list(histogram.counts),
+                   histogram.sum, histogram.count))
+            for key, histogram in _histograms.items()
+        )
+    lines = []
+    declared = set()
+    for (name, labels), value in counters:
+        if name not in declared:
+            declared.add(name)
+            lines.append(f'# TYPE {name} counter')
+        lines.append(f'{name}{_format_labels(labels)} {value:g}')
+    for (name, labels), (buckets, counts, total, count) in histograms:
+        if name not in declared:
+            declared.add(name)
+            lines.append(f'# TYPE {name} histogram')
+        for bound, bucket_count in zip(buckets, counts):
+            bucket_labels = _format_labels(labels + (('le', f'{bound:g}'),))
+            lines.append(f'{name}_bucket{bucket_labels} {bucket_count}')
+        inf_labels = _format_labels(labels + (('le', '+Inf'),))
+        lines.append(f'{name}_bucket{inf_labels} {count}')
+        lines.append(f'{name}_sum{_format_labels(labels)} {total:g}')
+        lines.append(f'{name}_count{_format_labels(labels)} {count}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,42 @@
+import time
+
+from . import metrics
+from .queries import record_queries
+
+
+class MetricsMiddleware:
+    """Собирает метрики запросов к API по имени представления:
+    полное время, время в базе, число запросов и размер ответа.
+    Итог отдается клиенту в заголовке Server-Timing.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        with record_queries() as recorder:
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+        db_duration = recorder.duration
+        match = request.resolver_match
+        if match is None or match.namespace != 'api':
+            return response
+        labels = {'view': match.view_name, 'method': request.method}
+        metrics.increment(
+            'http_requests_total',
+            status=f'{response.status_code // 100}xx', **labels)
+        metrics.observe('http_request_duration_seconds', duration, **labels)
+        metrics.observe('http_request_db_seconds', db_duration, **labels)
+        metrics.observe('http_request_queries', recorder.count,
+                        buckets=metrics.QUERY_BUCKETS, **labels)
+        if not response.streaming:
+            metrics.observe('http_response_size_bytes', len(response.content),
+                            buckets=metrics.SIZE_BUCKETS, **labels)
+        metrics.record_request(
+            match.view_name, duration, response.status_code >= 500)
+        response['Server-Timing'] = (
+            f'app;dur={duration * 1000:.1f}, '
+            f'db;dur={db_duration * 1000:.1f};'
+            f'desc="{recorder.count} queries"'
+        )
+        return response
@@ -1,8 +1,42 @@
 from django.conf import settings
-from rest_framework.pagination import PageNumberPagination
+from rest_framework import serializers
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+def get_recipes_limit(request):
+    """Проверяет параметр recipes_limit и ограничивает его сверху.
+    Без параметра возвращает None: рецепты не ограничиваются.
+    """
+    recipes_limit = request.query_params.get('recipes_limit')
+    if not recipes_limit:
+        return None
+    try:
+        recipes_limit = int(recipes_limit)
+    except ValueError:
+        recipes_limit = -1
+    if recipes_limit < 0:
+        raise serializers.ValidationError({
+            'recipes_limit': 'Укажите неотрицательное целое число.'
+        })
+    return min(recipes_limit, settings.MAX_RECIPES_LIMIT)
 
 
 class LimitPageNumberPagination(PageNumberPagination):
     """ Пагинация. """
     page_size = settings.DEFAULT_PAGE_SIZE
     page_size_query_param = 'limit'
+
+
+class LimitCursorPagination(CursorPagination):
+    """ Курсорная пагинация без COUNT.
+    Порядок совпадает с Recipe.Meta.ordering, но в курсор попадает
+    только pub_date: id лишь упорядочивает рецепты с одинаковым
+    временем. Если такие рецепты оказываются на границе страницы,
+    курсор хранит предыдущее отличающееся pub_date и число рецептов
+    после него, и следующий запрос получает OFFSET на это число.
+    Удаление рецепта из этой группы между запросами страниц
+    сдвигает смещение: рецепт может быть пропущен или повторен.
+    """
+    page_size = settings.DEFAULT_PAGE_SIZE
+    page_size_query_param = 'limit'
+    ordering = ('-pub_date', '-id')
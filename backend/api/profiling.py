@@ -0,0 +1,226 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core import signing
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.http import HttpResponse
+from rest_framework import exceptions
+from rest_framework.serializers import Serializer
+from rest_framework.settings import api_settings
+
+from .queries import record_queries
+
+PROFILE_PARAM = '_profile'
+STORE_PARAM = '_profile_store'
+PROFILE_MODES = ('cpu', 'alloc')
+PROFILE_SALT = 'api.profiling'
+PROFILES_DIR = 'profiles/'
+
+
+def sign_profile_mode(mode):
+    """Подписанное значение параметра _profile."""
+    return signing.TimestampSigner(salt=PROFILE_SALT).sign(mode)
+
+
+def get_profile_mode(request):
+    """Режим профилирования из подписанного параметра запроса
+    или None, если параметр не передан или подпись неверна.
+    """
+    value = request.GET.get(PROFILE_PARAM)
+    if not value:
+        return None
+    try:
+        mode = signing.TimestampSigner(salt=PROFILE_SALT).unsign(
+            value, max_age=settings.PROFILE_SIGNATURE_MAX_AGE)
+    except signing.BadSignature:
+        return None
+    return mode if mode in PROFILE_MODES else None
+
+
+def is_staff_request(request):
+    """Проверяет, что запрос сделан сотрудником.
+    Аутентификация DRF выполняется во вьюсете, поэтому здесь
+    пользователь определяется теми же классами заранее.
+    """
+    if request.user.is_authenticated and request.user.is_staff:
+        return True
+    for authentication_class in api_settings.DEFAULT_AUTHENTICATION_CLASSES:
+        try:
+            result = authentication_class().authenticate(request)
+        except exceptions.APIException:
+            return False
+        if result is not None:
+            return result[0].is_staff
+    return False
+
+
+def report_queries(recorder, top):
+    """Самые долгие запросы по отпечаткам."""
+    counts, durations = recorder.group_by_fingerprint()
+    lines = [f'{"total_ms":>10} {"count":>6}  query']
+    for fingerprint, duration in sorted(
+            durations.items(), key=lambda item: -item[1])[:top]:
+        lines.append(f'{duration * 1000:10.2f} '
+                     f'{counts[fingerprint]:6}  {fingerprint}')
+    return lines
+
+
+class StackSampler(threading.Thread):
+    """Снимает стек потока запроса с заданным интервалом.
+    Стеки собираются в свернутом формате для flamegraph, а по
+    локальным переменным Serializer.to_representation определяется,
+    какое поле сериализатора выполнялось.
+    """
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.fields = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        to_representation = Serializer.to_representation.__code__
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            field_name = None
+            while frame is not None:
+                code = frame.f_code
+                names.append(
+                    f'{frame.f_globals.get("__name__")}:{code.co_name}')
+                if field_name is None and code is to_representation:
+                    field = frame.f_locals.get('field')
+                    if field is not None:
+                        field_name = (
+                            f'{type(frame.f_locals["self"]).__name__}.'
+                            f'{field.field_name}')
+                frame = frame.f_back
+            if names:
+                self.stacks[';'.join(reversed(names))] += 1
+            if field_name is not None:
+                self.fields[field_name] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def run_request(get_response, request):
+    """Выполняет запрос целиком, включая потоковый ответ."""
+    response = get_response(request)
+    if response.streaming:
+        response.streaming_content = [b''.join(response.streaming_content)]
+    return response
+
+
+def profile_cpu(get_response, request, top):
+    profiler = cProfile.Profile()
+    sampler = StackSampler(
+        threading.get_ident(), settings.PROFILE_SAMPLE_INTERVAL)
+    sampler.start()
+    profiler.enable()
+    try:
+        response = run_request(get_response, request)
+    finally:
+        profiler.disable()
+        sampler.stop()
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats(
+        'cumulative').print_stats(top)
+    lines = ['', '## Поля сериализаторов (сэмплы)']
+    lines.extend(f'{count:6}  {name}'
+                 for name, count in sampler.fields.most_common(top))
+    lines.extend(['', '## Функции (cProfile, по совокупному времени)'])
+    lines.append(stream.getvalue().strip())
+    lines.extend(['', '## Свернутые стеки (сэмплы)'])
+    lines.extend(f'{stack} {count}'
+                 for stack, count in sampler.stacks.most_common())
+    return response, lines
+
+
+def profile_alloc(get_response, request, top):
+    tracemalloc.start(settings.PROFILE_TRACEBACK_DEPTH)
+    try:
+        response = run_request(get_response, request)
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    ))
+    lines = ['', f'Пик памяти: {peak / 1024:.1f} KiB', '',
+             '## Выделения памяти по строкам']
+    lines.extend(
+        f'{stat.size / 1024:10.1f} KiB {stat.count:8}  {stat.traceback[0]}'
+        for stat in snapshot.statistics('lineno')[:top])
+    lines.extend(['', '## Самые крупные стеки выделений'])
+    for stat in snapshot.statistics('traceback')[:5]:
+        lines.append(f'{stat.size / 1024:.1f} KiB в {stat.count} блоках:')
+        lines.extend(f'    {line}' for line in stat.traceback.format())
+    return response, lines
+
+
+PROFILERS = {
+    'cpu': profile_cpu,
+    'alloc': profile_alloc,
+}
+
+
+class ProfilingMiddleware:
+    """Профилирует один запрос к API по подписанному параметру
+    _profile=cpu или _profile=alloc, если его сделал сотрудник.
+    Отчет возвращается вместо ответа или, с параметром _profile_store,
+    сохраняется в MEDIA_ROOT, а ссылка передается в X-Profile-Report.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = (request.path.startswith('/api/')
+                and get_profile_mode(request))
+        if not mode or not is_staff_request(request):
+            return self.get_response(request)
+        top = settings.PROFILE_TOP_N
+        started = time.perf_counter()
+        with record_queries() as recorder:
+            response, details = PROFILERS[mode](
+                self.get_response, request, top)
+        duration = time.perf_counter() - started
+        match = request.resolver_match
+        query = request.GET.copy()
+        query.pop(PROFILE_PARAM, None)
+        query.pop(STORE_PARAM, None)
+        path = request.path + (f'?{query.urlencode()}' if query else '')
+        lines = [
+            f'# Профиль {mode}: {request.method} {path}',
+            f'Представление: {match.view_name if match else "-"}, '
+            f'статус {response.status_code}, {duration * 1000:.1f} ms, '
+            f'запросов к базе {recorder.count}',
+            '',
+            '## Запросы к базе по отпечаткам',
+            *report_queries(recorder, top),
+            *details,
+        ]
+        report = '\n'.join(lines) + '\n'
+        if STORE_PARAM not in request.GET:
+            return HttpResponse(
+                report, content_type='text/plain; charset=utf-8')
+        name = default_storage.save(
+            os.path.join(PROFILES_DIR, f'{mode}-{uuid.uuid4().hex}.txt'),
+            ContentFile(report.encode()))
+        response['X-Profile-Report'] = request.build_absolute_uri(
+            default_storage.url(name))
+        return response
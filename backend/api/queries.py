@@ -0,0 +1,68 @@
+import re
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack, contextmanager
+
+from django.db import connections
+
+_literal_re = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_param_re = re.compile(r'%(?:\(\w+\))?s')
+_in_list_re = re.compile(r'\((?:\s*\?\s*,)+\s*\?\s*\)')
+_savepoint_re = re.compile(
+    r'\s*(?:SAVEPOINT|RELEASE SAVEPOINT|ROLLBACK TO SAVEPOINT)\b', re.I)
+
+
+def fingerprint_sql(sql):
+    """Запрос без литералов: одинаковые запросы с разными
+    параметрами дают один отпечаток.
+    """
+    sql = _literal_re.sub('?', _param_re.sub('?', sql))
+    return ' '.join(_in_list_re.sub('(...)', sql).split())
+
+
+class QueryRecorder:
+    """Обертка для connection.execute_wrapper: запоминает текст
+    и длительность каждого запроса к базе.
+    Точки сохранения вложенных atomic() не учитываются: их число
+    зависит от того, выполняется ли запрос внутри внешней транзакции
+    (тесты, замеры), а не от работы представления.
+    """
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if _savepoint_re.match(sql):
+            return execute(sql, params, many, context)
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - started))
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def duration(self):
+        return sum(duration for _, duration in self.queries)
+
+    def group_by_fingerprint(self):
+        """Число запросов и суммарное время по отпечаткам."""
+        counts = Counter()
+        durations = defaultdict(float)
+        for sql, duration in self.queries:
+            fingerprint = fingerprint_sql(sql)
+            counts[fingerprint] += 1
+            durations[fingerprint] += duration
+        return counts, durations
+
+
+@contextmanager
+def record_queries():
+    """Записывает запросы ко всем базам внутри блока."""
+    recorder = QueryRecorder()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        yield recorder
@@ -1,12 +1,19 @@
+from collections import Counter
+from contextlib import contextmanager
+
 from django.contrib.auth import authenticate, get_user_model
 from django.contrib.auth.hashers import make_password
+from django.core.files import File
+from django.db import transaction
 from djoser.serializers import UserSerializer as UserHandleSerializer
-from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
-                            ShoppingList, Tag)
+from recipes.models import (Favorite, ImageUpload, Ingredient,
+                            IngredientInRecipe, Recipe, ShoppingList, Tag)
+from recipes.shopping_cart import update_shopping_cart_totals
 from rest_framework import serializers, validators
 from users.models import Subscribe
 
-from .imagefield import Base64ImageField
+from .imagefield import Base64ImageField, ImageVariantField
+from .pagination import get_recipes_limit
 
 User = get_user_model()
 
@@ -37,8 +44,10 @@ class UserSerializer(UserHandleSerializer):
         """
         Проверка подписки.
         """
+        if hasattr(author, 'is_subscribed'):
+            return author.is_subscribed
         user = self.context.get('request').user
-        if user.is_anonymous:
+        if user.is_anonymous or user.pk == author.pk:
             return False
         return Subscribe.objects.filter(
             user=user, author=author).exists()
@@ -81,7 +90,7 @@ class SubscribeSerializer(serializers.ModelSerializer):
     """Сериализатор для работы с подписками пользователей."""
     is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField(read_only=True)
+    recipes_count = serializers.ReadOnlyField()
 
     class Meta:
         model = User
@@ -105,41 +114,29 @@ class SubscribeSerializer(serializers.ModelSerializer):
             'recipes_count'
         )
 
-    def validate(self, data):
-        """Проверка данных на уровне сериализатора."""
-        user = self.context.get('request').user
-        author = self.instance
-        if user == author:
-            raise serializers.ValidationError({
-                'errors': 'Ошибка подписки! Нельзя подписаться на самого себя.'
-            })
-        if Subscribe.objects.filter(user=user,
-                                    author=author).exists():
-            raise serializers.ValidationError({
-                'errors': 'Ошибка подписки! Нельзя подписаться повторно.'
-            })
-        return data
-
     def get_is_subscribed(self, obj):
         """Проверка подписки."""
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         user = self.context.get('request').user
         return Subscribe.objects.filter(
             user=user, author=obj).exists()
 
     def get_recipes(self, obj):
-        """Получение рецептов автора."""
-        request = self.context.get('request')
-        recipes_limit = request.GET.get('recipes_limit')
-        recipes = Recipe.objects.filter(author=obj)
-        if recipes_limit:
-            recipes = recipes[:int(recipes_limit)]
+        """Получение рецептов автора.
+        Список рецептов может быть заранее загружен вьюсетом
+        в атрибут limited_recipes.
+        """
+        if hasattr(obj, 'limited_recipes'):
+            recipes = obj.limited_recipes
+        else:
+            recipes_limit = get_recipes_limit(self.context.get('request'))
+            recipes = Recipe.objects.filter(author=obj)
+            if recipes_limit is not None:
+                recipes = recipes[:recipes_limit]
         serializer = FavoriteSubscribeSerializer(recipes, many=True)
         return serializer.data
 
-    def get_recipes_count(self, obj):
-        """Подсчет рецептов автора."""
-        return Recipe.objects.filter(author=obj).count()
-
 
 class IngredientSerializer(serializers.ModelSerializer):
     """Сериализатор для модели ингредиентов."""
@@ -177,7 +174,8 @@ class IngredientInRecipeSerializer(serializers.ModelSerializer):
 class RecipeSerializer(serializers.ModelSerializer):
     """Сериализатор рецепта."""
     tags = TagSerializer(read_only=True, many=True)
-    image = Base64ImageField(max_length=None)
+    image = Base64ImageField(max_length=None, required=False)
+    image_upload = serializers.UUIDField(write_only=True, required=False)
     author = UserSerializer(read_only=True)
     cooking_time = serializers.IntegerField()
     ingredients = IngredientInRecipeSerializer(
@@ -186,6 +184,9 @@ class RecipeSerializer(serializers.ModelSerializer):
     )
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    image_medium = ImageVariantField(source='image', variant='medium')
+    image_medium_webp = ImageVariantField(
+        source='image', variant='medium_webp')
 
     class Meta:
         model = Recipe
@@ -196,98 +197,189 @@ class RecipeSerializer(serializers.ModelSerializer):
             'ingredients',
             'name',
             'image',
+            'image_medium',
+            'image_medium_webp',
+            'image_upload',
             'text',
             'cooking_time',
             'is_favorited',
             'is_in_shopping_cart')
 
-    def validate_ingredient(self, data):
-        """Проверка данных на уровне сериализатора."""
-        ingredients = data.get('ingredients')
-        '''if not ingredients:
+    def validate_image_upload(self, token):
+        """Загрузка должна быть завершена и принадлежать автору."""
+        upload = ImageUpload.objects.filter(
+            token=token,
+            user=self.context['request'].user,
+            completed=True
+        ).first()
+        if upload is None:
+            raise serializers.ValidationError(
+                'Загрузка не найдена или еще не завершена.')
+        return upload
+
+    def validate(self, data):
+        """Проверка ингредиентов и тегов.
+        Все id проверяются одним запросом IN для ингредиентов и одним
+        для тегов. При частичном обновлении поля можно не передавать.
+        """
+        if self.instance is None and not (
+                data.get('image') or data.get('image_upload')):
+            raise serializers.ValidationError(
+                {'image': 'Добавьте изображение рецепта.'})
+        if data.get('ingredients') is not None or not self.partial:
+            data['ingredients'] = self.validate_ingredient(
+                data.get('ingredients'))
+        if data.get('tags') is not None or not self.partial:
+            data['tags'] = self.validate_tags(data.get('tags'))
+        return data
+
+    def validate_cooking_time(self, cooking_time):
+        if cooking_time < 1:
+            raise serializers.ValidationError(
+                'Время приготовления должно быть не меньше 1 минуты.')
+        return cooking_time
+
+    @contextmanager
+    def open_image(self, validated_data):
+        """Изображение из base64 или из завершенной загрузки.
+        Загрузка удаляется после успешного сохранения рецепта.
+        """
+        upload = validated_data.pop('image_upload', None)
+        if upload is None:
+            yield validated_data.pop('image', None)
+            return
+        validated_data.pop('image', None)
+        with open(upload.path, 'rb') as file:
+            yield File(file, name=f'{upload.token}.{upload.extension}')
+        transaction.on_commit(upload.discard)
+
+    def validate_ingredient(self, ingredients):
+        """Возвращает количества ингредиентов по их id."""
+        if not ingredients:
             raise serializers.ValidationError(
-                'Добавьте минимум один ингредиент для рецепта.'
-            )'''
-        added_ingredients = []
+                {'ingredients': 'Добавьте минимум один ингредиент '
+                                'для рецепта.'})
+        amounts = {}
         for ingredient in ingredients:
             try:
-                Ingredient.objects.get(
-                    id=ingredient['id']
-                )
-            except Exception:
+                ingredient_id = int(ingredient['id'])
+                amount = int(ingredient['amount'])
+            except (KeyError, TypeError, ValueError):
                 raise serializers.ValidationError(
-                    'Указанного ингредиента не существует'
-                )
-            ''' if int(ingredient['amount']) <= 0:
+                    {'ingredients': 'Укажите id и количество ингредиента.'})
+            if ingredient_id in amounts:
                 raise serializers.ValidationError(
-                    'Количество ингредиента должно '
-                    'быть больше 0.'
-                )'''
-
-            if ingredient['id'] in added_ingredients:
+                    {'ingredients': 'Такой ингридиент уже добавлен.'})
+            if amount < 1:
                 raise serializers.ValidationError(
-                    'Такой ингридиент уже добавлен.'
-                )
-            added_ingredients.append(ingredient['id'])
-        if int(ingredient['amount']) < 1:
+                    {'ingredients': 'Количество ингредиента должно '
+                                    'быть больше 0.'})
+            amounts[ingredient_id] = amount
+        existing = Ingredient.objects.filter(
+            id__in=amounts).order_by().values_list('id', flat=True)
+        missing = amounts.keys() - set(existing)
+        if missing:
             raise serializers.ValidationError(
-                'Добавьте минимум один ингредиент для рецепта.'
-            )
-        data['ingredients'] = ingredients
-        return data
+                {'ingredients': 'Указанного ингредиента не существует: '
+                                f'{", ".join(map(str, sorted(missing)))}.'})
+        return amounts
 
-    def validate_tags(self, data):
-        tags = data.get('tags')
+    def validate_tags(self, tags):
+        """Возвращает множество id тегов."""
         if not tags:
             raise serializers.ValidationError(
-                'Необходимо выбрать тег.')
-        for tag in tags:
-            all_tags = Tag.objects.all().values_list('id', flat=True)
-            if not set(tags).issubset(all_tags):
-                raise serializers.ValidationError(
-                    f'Тега {tag} не существует')
-
-        if len(tags) > len(set(tags)):
-            raise serializers.ValidationError('Тег уже используется.')
-
-        cooking_time = float(data.get('cooking_time'))
-        if cooking_time < 1:
+                {'tags': 'Необходимо выбрать тег.'})
+        try:
+            tag_ids = [int(tag) for tag in tags]
+        except (TypeError, ValueError):
             raise serializers.ValidationError(
-                'Время приготовления должно быть не меньше 1 минуты.')
-        data['tags'] = tags
-        return data
+                {'tags': 'Теги указываются списком id.'})
+        if len(tag_ids) > len(set(tag_ids)):
+            raise serializers.ValidationError(
+                {'tags': 'Тег уже используется.'})
+        existing = Tag.objects.filter(
+            id__in=tag_ids).order_by().values_list('id', flat=True)
+        missing = set(tag_ids) - set(existing)
+        if missing:
+            raise serializers.ValidationError(
+                {'tags': 'Тега не существует: '
+                         f'{", ".join(map(str, sorted(missing)))}.'})
+        return set(tag_ids)
 
     @staticmethod
-    def __create_ingredients(recipe, ingredients):
+    def __create_ingredients(recipe, amounts):
         """Создание ингредиентов в промежуточной таблице."""
         IngredientInRecipe.objects.bulk_create(
             [IngredientInRecipe(recipe=recipe,
-             ingredient_id=ingredient.get('id'),
-             amount=ingredient.get('amount'))
-             for ingredient in ingredients])
-
+             ingredient_id=ingredient_id,
+             amount=amount)
+             for ingredient_id, amount in amounts.items()])
+
+    def __update_ingredients(self, recipe, amounts):
+        """Приводит ингредиенты рецепта к amounts, меняя только
+        добавленные, удаленные и измененные строки.
+        Возвращает изменения количеств по ингредиентам.
+        """
+        deltas = Counter(amounts)
+        changed = []
+        removed = []
+        for item in IngredientInRecipe.objects.filter(recipe=recipe):
+            deltas[item.ingredient_id] -= item.amount
+            amount = amounts.pop(item.ingredient_id, None)
+            if amount is None:
+                removed.append(item.id)
+            elif amount != item.amount:
+                item.amount = amount
+                changed.append(item)
+        if removed:
+            IngredientInRecipe.objects.filter(id__in=removed).delete()
+        if changed:
+            IngredientInRecipe.objects.bulk_update(changed, ['amount'])
+        if amounts:
+            self.__create_ingredients(recipe, amounts)
+        return deltas
+
+    @transaction.atomic
     def create(self, validated_data):
         """Создание рецепта."""
-        image = validated_data.pop('image')
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
-        recipe = Recipe.objects.create(image=image, **validated_data)
+        with self.open_image(validated_data) as image:
+            recipe = Recipe.objects.create(image=image, **validated_data)
         recipe.tags.set(tags)
         self.__create_ingredients(recipe, ingredients)
+        recipe.update_search_vector()
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        """Обновление рецепта."""
-        instance.tags.clear()
-        instance.tags.set(validated_data.pop('tags'))
-        IngredientInRecipe.objects.filter(recipe=instance).delete()
-        self.__create_ingredients(
-            recipe=instance,
-            ingredients=validated_data.pop('ingredients')
-        )
-        super().update(instance, validated_data)
+        """Обновление рецепта.
+        Строка рецепта блокируется, чтобы параллельные правки
+        не испортили суммы в списках покупок.
+        """
+        Recipe.objects.select_for_update().filter(pk=instance.pk).exists()
+        tags = validated_data.pop('tags', None)
+        if tags is not None and tags != {
+                tag.id for tag in instance.tags.all()}:
+            instance.tags.set(tags)
+        ingredients = validated_data.pop('ingredients', None)
+        if ingredients is not None:
+            deltas = self.__update_ingredients(instance, ingredients)
+            if any(deltas.values()):
+                update_shopping_cart_totals(instance, deltas)
+        with self.open_image(validated_data) as image:
+            if image is not None:
+                validated_data['image'] = image
+            super().update(instance, validated_data)
+        instance.update_search_vector()
         return instance
 
+    def to_representation(self, instance):
+        """Передает аннотацию подписки вложенному сериализатору автора."""
+        if hasattr(instance, 'author_is_subscribed'):
+            instance.author.is_subscribed = instance.author_is_subscribed
+        return super().to_representation(instance)
+
     def to_internal_value(self, data):
         ingredients = data.get('ingredients')
         tags = data.get('tags')
@@ -298,6 +390,8 @@ class RecipeSerializer(serializers.ModelSerializer):
 
     def get_is_favorited(self, obj):
         """Проверка рецепта в избранном."""
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
@@ -305,6 +399,8 @@ class RecipeSerializer(serializers.ModelSerializer):
 
     def get_is_in_shopping_cart(self, obj):
         """Проверка списка покупок."""
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user = self.context.get('request').user
         if not user or user.is_anonymous:
             return False
@@ -314,45 +410,21 @@ class RecipeSerializer(serializers.ModelSerializer):
 
 class FavoriteSubscribeSerializer(serializers.ModelSerializer):
     """Сериализатор для избранного и подписок."""
+    image_small = ImageVariantField(source='image', variant='small')
+    image_small_webp = ImageVariantField(
+        source='image', variant='small_webp')
 
     class Meta:
         model = Recipe
-        fields = ['id', 'name', 'image', 'cooking_time']
+        fields = ['id', 'name', 'image', 'image_small', 'image_small_webp',
+                  'cooking_time']
         read_only_fields = ['id', 'name', 'image', 'cooking_time']
 
-    def validate_favorite(self, data, user, recipe):
-        """Валидация добавления и удаления из избранного."""
-        if self.context.get('request').method == 'POST':
-            if Favorite.objects.filter(user=user, recipe=recipe).exists():
-                raise serializers.ValidationError('Рецепт уже в избранном.')
-            return data
-
-        if self.context.get('request').method == 'DELETE':
-            if Favorite.objects.filter(user=user, recipe=recipe).exists():
-                return data
-            raise serializers.ValidationError('Этого рецепта нет в избранном.')
-
-    def validate_shopping_cart(self, data, user, recipe):
-        """Валидация добавления и удаления в список покупок."""
-        if self.context.get('request').method == 'POST':
-            if ShoppingList.objects.filter(user=user, recipe=recipe).exists():
-                raise serializers.ValidationError(
-                    'Рецепт уже в списке покупок.')
-            return data
 
-        if self.context.get('request').method == 'DELETE':
-            if ShoppingList.objects.filter(user=user, recipe=recipe).exists():
-                return data
-            raise serializers.ValidationError(
-                'Этого рецепта нет в списке покупок.')
+class ImageUploadSerializer(serializers.ModelSerializer):
+    """Сериализатор загрузки изображения по частям."""
 
-    def validate(self, data):
-        """Вызов валидирующей функции и возврат валидированных данных."""
-        user = self.context.get('request').user
-        recipe = self.instance
-
-        if self.context.get('action_name') == 'favorite':
-            return self.validate_favorite(data, user, recipe)
-
-        if self.context.get('action_name') == 'shopping_cart':
-            return self.validate_shopping_cart(data, user, recipe)
+    class Meta:
+        model = ImageUpload
+        fields = ('token', 'size', 'offset', 'completed')
+        read_only_fields = fields
@@ -0,0 +1,43 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from recipes.models import Ingredient, Tag
+from rest_framework.authtoken.models import Token
+
+from .authentication import invalidate_token_cache
+from .cache import invalidate_data_version
+from .ingredient_index import ingredient_index
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_ingredient_index(sender, **kwargs):
+    """Сбрасывает индекс ингредиентов при их изменении."""
+    ingredient_index.invalidate()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def update_data_version(sender, **kwargs):
+    """Сбрасывает версию справочника, а с ней ETag и кеш ответов."""
+    invalidate_data_version(sender)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    """Сбрасывает кеш токена при выходе пользователя."""
+    invalidate_token_cache(instance.key)
+
+
+@receiver(post_save, sender=get_user_model())
+def invalidate_user_tokens(sender, instance, created, update_fields,
+                           **kwargs):
+    """Сбрасывает кеш токенов пользователя при изменении его данных,
+    в том числе при деактивации.
+    """
+    if created or update_fields == frozenset(('last_login',)):
+        return
+    invalidate_token_cache(*Token.objects.filter(
+        user=instance).values_list('key', flat=True))
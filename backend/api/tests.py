@@ -0,0 +1,336 @@
+import base64
+import io
+import shutil
+import tempfile
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
+                            ShoppingCartTotal, ShoppingList, Tag)
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from users.models import Subscribe, User
+
+from .authentication import get_token_cache_key
+
+RECIPES_URL = '/api/recipes/?limit=50'
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def get_image_data():
+    buffer = io.BytesIO()
+    Image.new('RGB', (10, 10), '#E26C2D').save(buffer, 'PNG')
+    return ('data:image/png;base64,'
+            + base64.b64encode(buffer.getvalue()).decode())
+
+
+class RecipeListQueriesTest(TestCase):
+    """Число запросов к базе при выводе списка рецептов
+    не зависит от количества рецептов на странице.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass')
+        cls.authors = [
+            User.objects.create_user(
+                username=f'author{number}',
+                email=f'author{number}@example.com',
+                password='pass')
+            for number in range(3)
+        ]
+        cls.tags = Tag.objects.bulk_create([
+            Tag(name='Завтрак', color='#E26C2D', slug='breakfast'),
+            Tag(name='Обед', color='#49B64E', slug='lunch'),
+        ])
+        cls.ingredients = Ingredient.objects.bulk_create([
+            Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(5)
+        ])
+        Subscribe.objects.create(user=cls.user, author=cls.authors[0])
+
+    def create_recipes(self, count):
+        start = Recipe.objects.count()
+        recipes = Recipe.objects.bulk_create([
+            Recipe(author=self.authors[number % len(self.authors)],
+                   name=f'Рецепт {number}',
+                   text='Описание',
+                   image='recipes/images/test.jpg',
+                   cooking_time=10)
+            for number in range(start, start + count)
+        ])
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe_id=recipe.id, tag_id=tag.id)
+            for recipe in recipes for tag in self.tags
+        ])
+        IngredientInRecipe.objects.bulk_create([
+            IngredientInRecipe(recipe=recipe, ingredient=ingredient,
+                               amount=10)
+            for recipe in recipes for ingredient in self.ingredients
+        ])
+        Favorite.objects.bulk_create([
+            Favorite(user=self.user, recipe=recipe) for recipe in recipes[::2]
+        ])
+        ShoppingList.objects.bulk_create([
+            ShoppingList(user=self.user, recipe=recipe)
+            for recipe in recipes[::3]
+        ])
+
+    def count_queries(self, client):
+        client.get(RECIPES_URL)
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(RECIPES_URL)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), len(response.json()['results'])
+
+    def assert_constant_queries(self, client, limit):
+        self.create_recipes(3)
+        small, shown = self.count_queries(client)
+        self.assertEqual(shown, 3)
+        self.create_recipes(47)
+        large, shown = self.count_queries(client)
+        self.assertEqual(shown, 50)
+        self.assertEqual(large, small)
+        self.assertLessEqual(large, limit)
+
+    def test_anonymous_list(self):
+        self.assert_constant_queries(APIClient(), 5)
+
+    def test_authenticated_list(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assert_constant_queries(client, 5)
+
+
+class ToggleEndpointsTest(TestCase):
+    """Добавление и удаление избранного, списка покупок и подписок."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass')
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass')
+        cls.ingredient = Ingredient.objects.create(
+            name='Соль', measurement_unit='г')
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Рецепт', text='Описание',
+            image='recipes/images/test.jpg', cooking_time=10)
+        IngredientInRecipe.objects.create(
+            recipe=cls.recipe, ingredient=cls.ingredient, amount=5)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assert_toggle(self, url, missing_url):
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.client.post(url).status_code, 400)
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.client.delete(url).status_code, 400)
+        self.assertEqual(self.client.post(missing_url).status_code, 404)
+        self.assertEqual(self.client.delete(missing_url).status_code, 404)
+        return response
+
+    def test_favorite(self):
+        url = f'/api/recipes/{self.recipe.id}/favorite/'
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['id'], self.recipe.id)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 1)
+        self.assertEqual(self.client.post(url).status_code, 400)
+        self.client.delete(url)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 0)
+        self.assert_toggle(url, '/api/recipes/0/favorite/')
+        self.assertFalse(Favorite.objects.exists())
+
+    def test_image_variants(self):
+        url = f'/api/recipes/{self.recipe.id}/favorite/'
+        data = self.client.post(url).json()
+        self.assertTrue(data['image'].endswith('/test.jpg'))
+        self.assertEqual(data['image_small'], data['image'])
+        self.client.delete(url)
+        Recipe.objects.filter(pk=self.recipe.pk).update(
+            variants_image=self.recipe.image.name)
+        data = self.client.post(url).json()
+        self.assertTrue(data['image'].endswith('/test.jpg'))
+        self.assertTrue(data['image_small'].endswith('/test_small.jpg'))
+        self.assertTrue(
+            data['image_small_webp'].endswith('/test_small.webp'))
+
+    def test_shopping_cart(self):
+        url = f'/api/recipes/{self.recipe.id}/shopping_cart/'
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['name'], self.recipe.name)
+        self.assertEqual(
+            ShoppingCartTotal.objects.get(
+                user=self.user, ingredient=self.ingredient).amount,
+            5)
+        self.client.delete(url)
+        self.assertFalse(ShoppingCartTotal.objects.exists())
+        self.assert_toggle(url, '/api/recipes/0/shopping_cart/')
+        self.assertFalse(ShoppingList.objects.exists())
+
+    def test_subscribe(self):
+        url = f'/api/users/{self.author.id}/subscribe/'
+        data = self.assert_toggle(url, '/api/users/0/subscribe/').json()
+        self.assertTrue(data['is_subscribed'])
+        self.assertEqual(data['recipes'][0]['id'], self.recipe.id)
+        self.client.post(url)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.subscribers_count, 1)
+        self.client.delete(url)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.subscribers_count, 0)
+
+    def test_self_subscribe(self):
+        response = self.client.post(f'/api/users/{self.user.id}/subscribe/')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Subscribe.objects.exists())
+
+
+class ReferenceDataCacheTest(TestCase):
+    """ETag справочника выводится из данных, а не из случайной метки."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Tag.objects.create(name='Завтрак', color='#E26C2D', slug='breakfast')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_etag_follows_data(self):
+        etag = self.client.get('/api/tags/')['ETag']
+        # Другой процесс со своим кешем получает тот же ETag.
+        cache.clear()
+        self.assertEqual(self.client.get('/api/tags/')['ETag'], etag)
+        response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(name='Обед', color='#49B64E', slug='lunch')
+        response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 2)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class TokenCacheTest(TestCase):
+    """Кеш аутентификации по токену."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass')
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_cached_user(self):
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+        self.assertEqual(
+            cache.get(get_token_cache_key(self.token.key)),
+            (self.user.id, True))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/users/me/')
+        self.assertEqual(response.json()['username'], 'reader')
+        # Отложенные поля пользователя загружаются одним запросом.
+        self.assertEqual(
+            sum('users_user' in query['sql'] for query in queries), 1)
+
+    def test_deactivated_user(self):
+        self.client.get('/api/users/me/')
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 401)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class RecipeWriteTest(TestCase):
+    """Создание и изменение рецепта с большим числом ингредиентов
+    укладываются в бюджет запросов представления.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='author', email='author@example.com', password='pass')
+        cls.tag = Tag.objects.create(
+            name='Завтрак', color='#E26C2D', slug='breakfast')
+        cls.ingredients = Ingredient.objects.bulk_create([
+            Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(40)
+        ])
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get_body(self, ingredients, amount=10):
+        return {
+            'name': 'Рецепт',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'tags': [self.tag.id],
+            'image': get_image_data(),
+            'ingredients': [
+                {'id': ingredient.id, 'amount': amount}
+                for ingredient in ingredients
+            ],
+        }
+
+    def test_many_ingredients(self):
+        response = self.client.post(
+            '/api/recipes/', self.get_body(self.ingredients[:30]),
+            format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()['ingredients']), 30)
+        response = self.client.patch(
+            f'/api/recipes/{response.json()["id"]}/',
+            self.get_body(self.ingredients[10:], amount=20), format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            {item['amount'] for item in response.json()['ingredients']},
+            {20})
+        self.assertEqual(len(response.json()['ingredients']), 30)
+
+    def count_queries(self, method, url, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, data, format='json')
+        self.assertLess(response.status_code, 300)
+        return len(queries), response.json()
+
+    def test_write_and_detail_queries(self):
+        """Число запросов не зависит от числа ингредиентов."""
+        counts = []
+        for size in (1, 20):
+            create, recipe = self.count_queries(
+                'post', '/api/recipes/',
+                self.get_body(self.ingredients[:size]))
+            url = f'/api/recipes/{recipe["id"]}/'
+            update, _ = self.count_queries(
+                'patch', url, self.get_body(self.ingredients[-size:]))
+            detail, _ = self.count_queries('get', url)
+            counts.append((create, update, detail))
+        self.assertEqual(counts[0], counts[1])
+        create, update, detail = counts[0]
+        # Включая точки сохранения atomic() внутри транзакции теста.
+        self.assertLessEqual(create, 15)
+        self.assertLessEqual(update, 18)
+        self.assertLessEqual(detail, 4)
@@ -0,0 +1,88 @@
+import os
+
+from django.conf import settings
+from rest_framework import serializers
+
+from .imagefield import Base64ImageField
+
+CHUNK_SIZE = 64 * 1024
+
+
+class InvalidUploadImage(serializers.ValidationError):
+    """Полученный файл не является допустимым изображением.
+    Загрузку нужно удалить после выхода из транзакции, иначе откат
+    вернет строку, а файла уже не будет.
+    """
+
+
+def get_upload_stream(request):
+    """Тело запроса для загрузки: файл image из multipart-формы
+    или необработанные байты. Возвращает поток и его длину.
+    """
+    if request.content_type.startswith('multipart/form-data'):
+        file = request.FILES.get('image')
+        if file is None:
+            raise serializers.ValidationError(
+                {'image': 'Передайте файл в поле image.'})
+        return file, file.size
+    length = int(request.META.get('CONTENT_LENGTH') or 0)
+    if not length:
+        return None, 0
+    return request.stream, length
+
+
+def get_header_int(request, header):
+    value = request.META.get('HTTP_' + header.upper().replace('-', '_'))
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise serializers.ValidationError(
+            {header: 'Укажите заголовок с целым числом.'})
+    if value < 0:
+        raise serializers.ValidationError(
+            {header: 'Значение не может быть отрицательным.'})
+    return value
+
+
+def validate_upload_size(size):
+    max_size = settings.MAX_IMAGE_UPLOAD_SIZE
+    if not 0 < size <= max_size:
+        raise serializers.ValidationError({
+            'Upload-Length': f'Размер файла должен быть от 1 до {max_size} '
+                             'байт.'
+        })
+
+
+def append_chunk(upload, stream):
+    """Дописывает часть файла и завершает загрузку, если она получена
+    целиком. Вызывается под блокировкой строки загрузки.
+    """
+    os.makedirs(settings.IMAGE_UPLOAD_DIR, exist_ok=True)
+    remaining = upload.size - upload.offset
+    with open(upload.path, 'ab') as file:
+        file.truncate(upload.offset)
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            if len(chunk) > remaining:
+                file.truncate(upload.offset)
+                raise serializers.ValidationError(
+                    'Получено больше данных, чем объявлено в Upload-Length.')
+            file.write(chunk)
+            remaining -= len(chunk)
+        upload.offset = file.tell()
+    if upload.offset == upload.size:
+        finish_upload(upload)
+    upload.save(update_fields=('offset', 'extension', 'completed'))
+
+
+def finish_upload(upload):
+    """Проверяет полученное изображение и отмечает загрузку завершенной."""
+    try:
+        with open(upload.path, 'rb') as file:
+            image_format = Base64ImageField().validate_image(file)
+    except serializers.ValidationError as error:
+        raise InvalidUploadImage(error.detail) from error
+    upload.extension = image_format.lower()
+    upload.completed = True
@@ -2,10 +2,10 @@ from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
 from .views import (CustomUserViewSet, FavoriteRecipeViewSet,
-                    IngredientsViewSet, RecipesViewSet,
+                    ImageUploadViewSet, IngredientsViewSet, RecipesViewSet,
                     ShoppingcartListViewSet, ShoppingcartViewSet,
                     SubscribeListViewSet, SubscribePostDeleteViewSet,
-                    TagsViewSet, set_password)
+                    TagsViewSet, metrics_view, set_password)
 
 app_name = 'api'
 
@@ -22,6 +22,7 @@ router.register(r'recipes/(?P<recipe_id>\d+)/shopping_cart',
 router.register(r'recipes/download_shopping_cart',
                 ShoppingcartListViewSet, basename='shopping_cart')
 router.register('recipes', RecipesViewSet, basename='recipes')
+router.register('uploads', ImageUploadViewSet, basename='uploads')
 router.register('tags', TagsViewSet, basename='tags')
 router.register('ingredients', IngredientsViewSet, basename='ingredients')
 
@@ -29,5 +30,6 @@ router.register('ingredients', IngredientsViewSet, basename='ingredients')
 urlpatterns = [
     path('', include(router.urls)),
     path('users/set_password/', set_password, name='set_password'),
+    path('metrics/', metrics_view, name='metrics'),
     path('auth/', include('djoser.urls.authtoken'), name='auth'),
 ]
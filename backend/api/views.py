@@ -1,26 +1,79 @@
+from collections import defaultdict
+
 from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import (BooleanField, Exists, F, OuterRef,
+                              Prefetch, Value, Window)
+from django.db.models.functions import RowNumber
+from django.http import Http404, HttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet as DjoserUserViewSet
-from recipes.models import Favorite, Ingredient, Recipe, ShoppingList, Tag
-from rest_framework import filters, mixins, serializers, status, viewsets
-from rest_framework.decorators import action, api_view
+from recipes import toggles
+from recipes.counters import change_counter
+from recipes.models import (Favorite, ImageUpload, Ingredient,
+                            IngredientInRecipe, Recipe, ShoppingList, Tag)
+from rest_framework import filters, mixins, status, viewsets
+from rest_framework.decorators import (action, api_view,
+                                       permission_classes)
 from rest_framework.generics import get_object_or_404
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import (AllowAny, IsAdminUser,
+                                        IsAuthenticated)
 from rest_framework.response import Response
 from rest_framework.viewsets import ReadOnlyModelViewSet
 from users.models import Subscribe
 
-from .creatinglist import collect_shopping_cart
+from . import metrics
+from .budgets import query_budget
+from .cache import ConditionalCacheMixin
+from .creatinglist import (IgnoreFormatContentNegotiation,
+                           collect_shopping_cart)
 from .filters import IngredientFilter, RecipeFilter
-from .pagination import LimitPageNumberPagination
+from .ingredient_index import ingredient_index
+from .pagination import (LimitCursorPagination, LimitPageNumberPagination,
+                         get_recipes_limit)
 from .permissions import IsAdminUserOrReadOnly, IsOwnerOrReadOnly
-from .serializers import (FavoriteSubscribeSerializer, IngredientSerializer,
-                          RecipeSerializer, SubscribeSerializer, TagSerializer,
-                          UserSerializer)
+from .serializers import (FavoriteSubscribeSerializer, ImageUploadSerializer,
+                          IngredientSerializer, RecipeSerializer,
+                          SubscribeSerializer, TagSerializer, UserSerializer)
+from .uploads import (InvalidUploadImage, append_chunk, get_header_int,
+                      get_upload_stream, validate_upload_size)
 
 User = get_user_model()
 
 
+def get_recipes_by_author(author_ids, recipes_limit=None):
+    """Первые recipes_limit рецептов каждого автора одним запросом.
+    Рецепты нумеруются оконной функцией ROW_NUMBER() в разрезе автора.
+    """
+    recipes = defaultdict(list)
+    if not author_ids:
+        return recipes
+    queryset = Recipe.objects.filter(author_id__in=author_ids)
+    if recipes_limit is None:
+        rows = queryset.only('id', 'name', 'image', 'variants_image',
+                             'cooking_time', 'author')
+    else:
+        sql, params = queryset.annotate(row_number=Window(
+            expression=RowNumber(),
+            partition_by=[F('author_id')],
+            order_by=[F('pub_date').desc(), F('id').desc()]
+        )).values(
+            'id', 'name', 'image', 'variants_image', 'cooking_time',
+            'author_id', 'row_number'
+        ).query.sql_with_params()
+        rows = Recipe.objects.raw(
+            f'SELECT * FROM ({sql}) AS ranked '
+            'WHERE ranked.row_number <= %s '
+            'ORDER BY ranked.author_id, ranked.row_number',
+            (*params, recipes_limit)
+        )
+    for recipe in rows:
+        recipes[recipe.author_id].append(recipe)
+    return recipes
+
+
+@query_budget(4)
 @api_view(['post'])
 def set_password(request):
     """Функция-обработчик для эндпоинта /users/set_password/.
@@ -39,18 +92,49 @@ def set_password(request):
         status=status.HTTP_400_BAD_REQUEST)
 
 
+@query_budget(2)
+@api_view(['get'])
+@permission_classes((IsAdminUser,))
+def metrics_view(request):
+    """Функция-обработчик для эндпоинта /metrics/.
+    Отдает метрики процесса в текстовом формате Prometheus.
+    """
+    return HttpResponse(
+        metrics.render_prometheus(),
+        content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 class CustomUserViewSet(DjoserUserViewSet):
     """Вьюсет для работы с пользователями"""
     queryset = User.objects.all()
     serializer_class = UserSerializer
     filter_backends = (DjangoFilterBackend, filters.SearchFilter,)
     search_fields = ('username', 'email')
+    query_budgets = {
+        'list': 4,
+        'retrieve': 3,
+        'me': 4,
+        'create': 6,
+        'set_password': 4,
+    }
 
     def get_permissions(self):
         if self.action in ['me']:
             return (IsAuthenticated(),)
         return (AllowAny(),)
 
+    def get_queryset(self):
+        """Пользователи с флагом подписки, вычисленным подзапросом EXISTS.
+        Для анонимного пользователя подставляется константа False.
+        """
+        queryset = super().get_queryset()
+        user = self.request.user
+        if user.is_anonymous:
+            return queryset.annotate(
+                is_subscribed=Value(False, output_field=BooleanField()))
+        return queryset.annotate(is_subscribed=Exists(
+            Subscribe.objects.filter(user=user, author=OuterRef('pk'))))
+
 
 class SubscribePostDeleteViewSet(viewsets.ModelViewSet):
     """Вьюсет для работы с подписками"""
@@ -59,51 +143,36 @@ class SubscribePostDeleteViewSet(viewsets.ModelViewSet):
     pagination_class = LimitPageNumberPagination
     permission_classes = (IsOwnerOrReadOnly,)
     http_method_names = ['post', 'delete']
+    query_budgets = {
+        'create': 4,
+        'delete': 2,
+    }
 
     def create(self, request, author_id):
-        user = request.user
-        author = get_object_or_404(User, id=author_id)
-
-        serializer = SubscribeSerializer(
-            author,
-            data=request.data,
-            context={'request': request})
-        serializer.is_valid(raise_exception=True)
-        if user == author:
+        if int(author_id) == request.user.id:
             return Response({
                 'errors': 'Нельзя подписаться на самого себя'
             }, status=status.HTTP_400_BAD_REQUEST)
-
-        if Subscribe.objects.filter(user=user, author=author).exists():
+        author, created = toggles.subscribe(request.user, author_id)
+        if author is None:
+            raise Http404
+        if not created:
             return Response({
                 'errors': 'Вы уже подписаны на данного пользователя'
             }, status=status.HTTP_400_BAD_REQUEST)
-        Subscribe.objects.create(user=user, author=author)
+        author.is_subscribed = True
+        serializer = SubscribeSerializer(
+            author, context={'request': request})
         return Response(serializer.data,
                         status=status.HTTP_201_CREATED)
 
     def delete(self, request, author_id):
-        user = request.user
-        author = get_object_or_404(User, id=author_id)
-        SubscribeSerializer(
-            author,
-            data=request.data,
-            context={'request': request})
-
-        if not Subscribe.objects.filter(
-            user=user,
-            author=author
-        ).exists():
-            raise serializers.ValidationError(
-                'Нет такой подписки'
-            )
-        subscription = get_object_or_404(
-            Subscribe,
-            user=user,
-            author=author
-        )
-        subscription.delete()
-
+        exists, deleted = toggles.unsubscribe(request.user, author_id)
+        if not exists:
+            raise Http404
+        if not deleted:
+            return Response({'errors': 'Нет такой подписки'},
+                            status=status.HTTP_400_BAD_REQUEST)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -117,30 +186,39 @@ class SubscribeListViewSet(mixins.ListModelMixin,
     pagination_class = LimitPageNumberPagination
     permission_classes = (IsOwnerOrReadOnly,)
     http_method_names = ['get', 'head']
+    query_budgets = {'list': 5}
 
     def list(self, request):
         """Функция-обработчик для эндпоинта /users/subscriptions/.
         Просмотр подписок ползователя."""
         user = request.user
+        recipes_limit = get_recipes_limit(request)
         user_subscribing = User.objects.filter(
             subscribing__user=user
+        ).annotate(
+            is_subscribed=Value(True, output_field=BooleanField())
         )
         page = self.paginate_queryset(user_subscribing)
+        recipes = get_recipes_by_author(
+            [author.id for author in page], recipes_limit)
+        for author in page:
+            author.limited_recipes = recipes[author.id]
         serializer = SubscribeSerializer(
             page, context={'request': request}, many=True
         )
         return self.get_paginated_response(serializer.data)
 
 
-class TagsViewSet(ReadOnlyModelViewSet):
+class TagsViewSet(ConditionalCacheMixin, ReadOnlyModelViewSet):
     """Вьюсет для работы с тегами."""
     queryset = Tag.objects.all()
     permission_classes = (IsAdminUserOrReadOnly,)
     serializer_class = TagSerializer
     pagination_class = None
+    query_budgets = {'list': 2, 'retrieve': 2}
 
 
-class IngredientsViewSet(ReadOnlyModelViewSet):
+class IngredientsViewSet(ConditionalCacheMixin, ReadOnlyModelViewSet):
     """Вьюсет для работы с ингредиентами."""
     queryset = Ingredient.objects.all()
     permission_classes = (IsAdminUserOrReadOnly,)
@@ -148,19 +226,180 @@ class IngredientsViewSet(ReadOnlyModelViewSet):
     filter_backends = (IngredientFilter,)
     search_fields = ('^name',)
     pagination_class = None
+    query_budgets = {'list': 2, 'retrieve': 2}
+
+    def list(self, request, *args, **kwargs):
+        """Автодополнение по параметру name обслуживается индексом
+        в памяти без обращения к базе данных."""
+        name = request.query_params.get('name')
+        if name:
+            return Response(ingredient_index.search(name))
+        return super().list(request, *args, **kwargs)
 
 
 class RecipesViewSet(viewsets.ModelViewSet):
     """Вьюсет для работы с рецептами."""
-    queryset = Recipe.objects.all()
+    queryset = Recipe.objects.select_related('author').prefetch_related(
+        Prefetch('tags', queryset=Tag.objects.all()),
+        Prefetch(
+            'ingredient_in_recipe',
+            queryset=IngredientInRecipe.objects.select_related('ingredient')
+        ),
+    )
     serializer_class = RecipeSerializer
     pagination_class = LimitPageNumberPagination
+    cursor_pagination_class = LimitCursorPagination
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
     permission_classes = (IsOwnerOrReadOnly, IsAdminUserOrReadOnly,)
+    query_budgets = {
+        'list': 7,
+        'retrieve': 5,
+        'create': 12,
+        'update': 17,
+        'partial_update': 17,
+        'destroy': 14,
+    }
+
+    @property
+    def paginator(self):
+        """Курсорная пагинация включается параметром pagination=cursor,
+        по умолчанию остается постраничная. С параметром search
+        всегда используется постраничная пагинация: курсор требует
+        порядка по дате и отбросил бы сортировку по релевантности."""
+        params = self.request.query_params
+        if (not hasattr(self, '_paginator')
+                and params.get('pagination') == 'cursor'
+                and not params.get('search')):
+            self._paginator = self.cursor_pagination_class()
+        return super().paginator
+
+    def get_queryset(self):
+        """Рецепты с флагами избранного, списка покупок и подписки.
+        Флаги вычисляются подзапросами EXISTS в том же запросе,
+        для анонимного пользователя подставляется константа False.
+        """
+        queryset = super().get_queryset()
+        user = self.request.user
+        if user.is_anonymous:
+            false = Value(False, output_field=BooleanField())
+            return queryset.annotate(
+                is_favorited=false,
+                is_in_shopping_cart=false,
+                author_is_subscribed=false
+            )
+        return queryset.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(ShoppingList.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            author_is_subscribed=Exists(Subscribe.objects.filter(
+                user=user, author=OuterRef('author')))
+        )
 
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user,)
+        with transaction.atomic():
+            serializer.save(author=self.request.user,)
+            change_counter(User, self.request.user.id, 'recipes_count', 1)
+        self.refresh_instance(serializer)
+
+    def perform_update(self, serializer):
+        serializer.save()
+        self.refresh_instance(serializer)
+
+    def refresh_instance(self, serializer):
+        """Перечитывает сохраненный рецепт через queryset вьюсета,
+        чтобы ответ использовал те же prefetch и аннотации, что и
+        чтение, и число запросов не зависело от числа ингредиентов.
+        """
+        serializer.instance = self.get_queryset().get(
+            pk=serializer.instance.pk)
+
+    def perform_destroy(self, instance):
+        """Строка рецепта блокируется до вычитания из сумм списков
+        покупок, чтобы параллельное добавление в список покупок
+        дождалось удаления."""
+        with transaction.atomic():
+            Recipe.objects.select_for_update().filter(
+                pk=instance.pk).exists()
+            instance.delete()
+            change_counter(User, instance.author_id, 'recipes_count', -1)
+
+
+class RawUploadParser(MultiPartParser):
+    """Пропускает тело запроса без разбора, кроме multipart-формы.
+    Необработанные байты читаются из request.stream частями.
+    """
+    media_type = '*/*'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if media_type and media_type.startswith('multipart/form-data'):
+            return super().parse(stream, media_type, parser_context)
+        return {}
+
+
+class ImageUploadViewSet(mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """Вьюсет для загрузки изображения рецепта по частям.
+    POST создает загрузку размером Upload-Length и может сразу принять
+    первую часть, PATCH дописывает часть с позиции Upload-Offset.
+    Завершенную загрузку рецепт получает по токену в image_upload.
+    """
+    serializer_class = ImageUploadSerializer
+    permission_classes = (IsAuthenticated,)
+    parser_classes = (RawUploadParser,)
+    lookup_field = 'token'
+    query_budgets = {
+        'create': 4,
+        'partial_update': 5,
+        'retrieve': 3,
+    }
+
+    def get_queryset(self):
+        return ImageUpload.objects.filter(user=self.request.user)
+
+    def get_response(self, upload, status_code=status.HTTP_200_OK):
+        response = Response(self.get_serializer(upload).data,
+                            status=status_code)
+        response['Upload-Offset'] = upload.offset
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_response(self.get_object())
+
+    def create(self, request):
+        stream, length = get_upload_stream(request)
+        if 'HTTP_UPLOAD_LENGTH' in request.META:
+            size = get_header_int(request, 'Upload-Length')
+        else:
+            size = length
+        validate_upload_size(size)
+        upload = ImageUpload.objects.create(user=request.user, size=size)
+        if stream is not None:
+            try:
+                append_chunk(upload, stream)
+            except InvalidUploadImage:
+                upload.discard()
+                raise
+        return self.get_response(upload, status.HTTP_201_CREATED)
+
+    def partial_update(self, request, token=None):
+        offset = get_header_int(request, 'Upload-Offset')
+        stream, length = get_upload_stream(request)
+        try:
+            with transaction.atomic():
+                upload = get_object_or_404(
+                    self.get_queryset().select_for_update(), token=token)
+                if upload.completed or offset != upload.offset:
+                    return self.get_response(
+                        upload, status.HTTP_409_CONFLICT)
+                if stream is not None:
+                    append_chunk(upload, stream)
+        except InvalidUploadImage:
+            # Удаление после отката транзакции, чтобы строка загрузки
+            # не пережила удаленный файл.
+            upload.discard()
+            raise
+        return self.get_response(upload)
 
 
 class FavoriteRecipeViewSet(RecipesViewSet):
@@ -169,36 +408,29 @@ class FavoriteRecipeViewSet(RecipesViewSet):
     serializer_class = FavoriteSubscribeSerializer
     http_method_names = ['post', 'delete']
     permission_classes = (IsOwnerOrReadOnly,)
+    query_budgets = {'create': 2, 'delete': 2}
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user,)
 
     def create(self, request, recipe_id):
-        user = self.request.user
-        recipe = get_object_or_404(Recipe, pk=recipe_id)
+        recipe, created = toggles.add_favorite(request.user, recipe_id)
+        if recipe is None:
+            raise Http404
+        if not created:
+            return Response({'errors': 'Рецепт уже в избранном.'},
+                            status=status.HTTP_400_BAD_REQUEST)
         serializer = FavoriteSubscribeSerializer(
-            recipe, data=request.data,
-            context={
-                'request': request,
-                'action_name': 'favorite'
-            }
-        )
-        serializer.is_valid(raise_exception=True)
-        Favorite.objects.create(user=user, recipe=recipe)
+            recipe, context={'request': request})
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def delete(self, request, recipe_id):
-        user = self.request.user
-        recipe = get_object_or_404(Recipe, pk=recipe_id)
-        serializer = FavoriteSubscribeSerializer(
-            recipe, data=request.data,
-            context={
-                'request': request,
-                'action_name': 'favorite'
-            }
-        )
-        serializer.is_valid(raise_exception=True)
-        Favorite.objects.filter(user=user, recipe=recipe).delete()
+        exists, deleted = toggles.remove_favorite(request.user, recipe_id)
+        if not exists:
+            raise Http404
+        if not deleted:
+            return Response({'errors': 'Этого рецепта нет в избранном.'},
+                            status=status.HTTP_400_BAD_REQUEST)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -211,33 +443,37 @@ class ShoppingcartViewSet(RecipesViewSet):
     filterset_class = RecipeFilter
     permission_classes = (IsOwnerOrReadOnly,)
     http_method_names = ['post', 'delete']
+    query_budgets = {
+        'create': 3,
+        'delete': 3,
+        'download_shopping_cart': 4,
+    }
 
     def create(self, request, recipe_id):
-        user = self.request.user
-        recipe = get_object_or_404(Recipe, pk=recipe_id)
+        recipe, created = toggles.add_to_shopping_cart(
+            request.user, recipe_id)
+        if recipe is None:
+            raise Http404
+        if not created:
+            return Response({'errors': 'Рецепт уже в списке покупок.'},
+                            status=status.HTTP_400_BAD_REQUEST)
         serializer = FavoriteSubscribeSerializer(
-            recipe, data=request.data,
-            context={
-                'request': request,
-                'action_name': 'shopping_cart'
-            }
-        )
-        serializer.is_valid(raise_exception=True)
-        ShoppingList.objects.create(user=user, recipe=recipe)
+            recipe, context={'request': request})
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def delete(self, request, recipe_id):
-        user = self.request.user
-        recipe = get_object_or_404(Recipe, pk=recipe_id)
-        obj = ShoppingList.objects.filter(user=user, recipe=recipe)
-        if obj.exists():
-            obj.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        return Response({'errors': 'Рецепт уже удален!'},
-                        status=status.HTTP_400_BAD_REQUEST)
+        exists, deleted = toggles.remove_from_shopping_cart(
+            request.user, recipe_id)
+        if not exists:
+            raise Http404
+        if not deleted:
+            return Response({'errors': 'Рецепт уже удален!'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(detail=False, methods=['GET'],
-            permission_classes=(IsOwnerOrReadOnly,))
+            permission_classes=(IsOwnerOrReadOnly,),
+            content_negotiation_class=IgnoreFormatContentNegotiation)
     def download_shopping_cart(self, request):
         """Функция-обработчик для эндпоинта
         /recipes/<id>/download_shopping_cart/.
@@ -252,7 +488,9 @@ class ShoppingcartListViewSet(viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     serializer_class = FavoriteSubscribeSerializer
     filterset_class = RecipeFilter
+    content_negotiation_class = IgnoreFormatContentNegotiation
     http_method_names = ['get', 'head']
+    query_budgets = {'list': 4}
 
     def list(self, request):
         user = request.user
@@ -0,0 +1,92 @@
+import hashlib
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+
+REPLICA = 'replica'
+PIN_COOKIE = 'primary_pin'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# Токены и сессии всегда читаются из основной базы: новый токен
+# может еще не дойти до реплики к первому запросу с ним.
+PRIMARY_ONLY_APPS = ('authtoken', 'sessions')
+
+_use_replica = ContextVar('use_replica', default=False)
+
+
+class ReplicaRouter:
+    """Чтения внутри запроса, отмеченного middleware, идут в реплику,
+    все остальное - в основную базу.
+    """
+    def db_for_read(self, model, **hints):
+        if (_use_replica.get() and settings.REPLICA_READS
+                and model._meta.app_label not in PRIMARY_ONLY_APPS):
+            return REPLICA
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA
+
+
+def get_pin_key(request):
+    authorization = request.META.get('HTTP_AUTHORIZATION')
+    if not authorization:
+        return None
+    return ('replica_pin:'
+            + hashlib.sha256(authorization.encode()).hexdigest())
+
+
+def is_pinned(request):
+    """Писал ли пользователь в последние REPLICA_PIN_SECONDS секунд."""
+    try:
+        if float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time():
+            return True
+    except ValueError:
+        pass
+    pin_key = get_pin_key(request)
+    return pin_key is not None and cache.get(pin_key) is not None
+
+
+def pin_to_primary(request, response):
+    """Закрепляет пользователя за основной базой после записи:
+    по токену в кеше и cookie для клиентов без токена.
+    """
+    timeout = settings.REPLICA_PIN_SECONDS
+    pin_key = get_pin_key(request)
+    if pin_key is not None:
+        cache.set(pin_key, 1, timeout)
+    response.set_cookie(
+        PIN_COOKIE, str(time.time() + timeout),
+        max_age=timeout, httponly=True, samesite='Lax')
+
+
+class ReplicaRoutingMiddleware:
+    """Направляет безопасные запросы к API в реплику.
+    После записи пользователь на REPLICA_PIN_SECONDS секунд
+    закрепляется за основной базой, чтобы видеть свои изменения.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.REPLICA_READS:
+            return self.get_response(request)
+        if request.method not in SAFE_METHODS:
+            response = self.get_response(request)
+            if response.status_code < 400:
+                pin_to_primary(request, response)
+            return response
+        use_replica = (request.path.startswith('/api/')
+                       and not is_pinned(request))
+        token = _use_replica.set(use_replica)
+        try:
+            return self.get_response(request)
+        finally:
+            _use_replica.reset(token)
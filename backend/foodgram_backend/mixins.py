@@ -0,0 +1,24 @@
+class CounterFieldsMixin:
+    """Не перезаписывает счетчики при обычном сохранении модели.
+    Счетчики меняются только атомарными UPDATE с F(), поэтому
+    сохранение загруженного ранее объекта не должно затирать
+    значения, изменившиеся за это время.
+    Если счетчики не загружены, сохранение их и так не затрагивает,
+    и оно выполняется без изменений. Иначе в update_fields попадают
+    загруженные поля без счетчиков: отложенные поля не загружаются.
+    """
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (not self._state.adding and not kwargs.get('force_insert')
+                and kwargs.get('update_fields') is None):
+            deferred_fields = self.get_deferred_fields()
+            if any(field not in deferred_fields
+                   for field in self.counter_fields):
+                kwargs['update_fields'] = [
+                    field.attname for field in self._meta.concrete_fields
+                    if not field.primary_key
+                    and field.attname not in deferred_fields
+                    and field.name not in self.counter_fields
+                ]
+        super().save(*args, **kwargs)
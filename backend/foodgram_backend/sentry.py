@@ -0,0 +1,30 @@
+from api import metrics
+from django.conf import settings
+from django.urls import Resolver404, resolve
+
+
+def get_view_name(path):
+    try:
+        return resolve(path).view_name
+    except Resolver404:
+        return None
+
+
+def traces_sampler(sampling_context):
+    """Доля трассировки запроса для Sentry.
+    Представления, которые по последним запросам отвечают медленно
+    или с ошибками, трассируются чаще остальных.
+    """
+    if sampling_context.get('parent_sampled') is not None:
+        return sampling_context['parent_sampled']
+    environ = sampling_context.get('wsgi_environ')
+    if environ is None:
+        return settings.SENTRY_TRACES_SAMPLE_RATE
+    view_name = get_view_name(environ.get('PATH_INFO', ''))
+    stats = view_name and metrics.get_recent_stats(view_name)
+    if stats is None:
+        return settings.SENTRY_TRACES_SAMPLE_RATE
+    p95, error_rate = stats
+    if p95 > settings.SLOW_REQUEST_SECONDS or error_rate > 0:
+        return settings.SENTRY_SLOW_TRACES_SAMPLE_RATE
+    return settings.SENTRY_TRACES_SAMPLE_RATE
@@ -2,22 +2,65 @@
 FoodGram Project
 """
 import os
+import sys
 from pathlib import Path
 
 import sentry_sdk
 from dotenv import load_dotenv
 from sentry_sdk.integrations.django import DjangoIntegration
 
+from .sentry import traces_sampler
+
 load_dotenv()
 
 DEFAULT_PAGE_SIZE: int = 6
 
+# Время хранения меток версий и готовых ответов справочников, в секундах.
+REFERENCE_DATA_CACHE_TIMEOUT: int = 300
+
+# Ограничения для изображений, загружаемых в base64.
+MAX_IMAGE_UPLOAD_SIZE: int = 10 * 1024 * 1024
+MAX_IMAGE_SIDE: int = 4096
+IMAGE_SPOOL_MAX_MEMORY: int = 1024 * 1024
+
+# Максимальное число рецептов автора на странице подписок.
+MAX_RECIPES_LIMIT: int = 50
+
+# Время жизни индекса ингредиентов для автодополнения, в секундах.
+INGREDIENT_INDEX_TTL: int = 300
+
+# Время хранения пользователя, найденного по токену, в секундах.
+AUTH_TOKEN_CACHE_TIMEOUT: int = 60
+
+# Сколько секунд после записи чтения пользователя идут в основную базу.
+REPLICA_PIN_SECONDS: int = 10
+
+# Профилирование запросов сотрудников по подписанному параметру _profile:
+# срок действия подписи в секундах, размер отчетов, интервал сэмплов
+# и глубина стеков tracemalloc.
+PROFILE_SIGNATURE_MAX_AGE: int = 3600
+PROFILE_TOP_N: int = 30
+PROFILE_SAMPLE_INTERVAL: float = 0.001
+PROFILE_TRACEBACK_DEPTH: int = 25
+
+# С какого числа строк админка показывает оценку из pg_class.reltuples
+# вместо точного COUNT(*) по всей таблице.
+ADMIN_ESTIMATED_COUNT_THRESHOLD: int = 10000
+
+# Доля трассируемых запросов в Sentry: обычных и тех представлений,
+# которые недавно отвечали дольше SLOW_REQUEST_SECONDS или с ошибкой.
+SENTRY_TRACES_SAMPLE_RATE: float = float(
+    os.getenv('SENTRY_TRACES_SAMPLE_RATE', 0.05))
+SENTRY_SLOW_TRACES_SAMPLE_RATE: float = float(
+    os.getenv('SENTRY_SLOW_TRACES_SAMPLE_RATE', 1.0))
+SLOW_REQUEST_SECONDS: float = 0.5
+
 sentry_sdk.init(
     dsn=os.getenv('sentry_sdk_keys'),
     integrations=[
         DjangoIntegration(),
     ],
-    traces_sample_rate=1.0,
+    traces_sampler=traces_sampler,
     send_default_pii=True
 )
 
@@ -27,6 +70,16 @@ SECRET_KEY = os.getenv('SECRET_KEY', 'Error SECRET_KEY')
 
 DEBUG = os.getenv('DEBUG', 'False') == 'True'
 
+# Превышение бюджета запросов к базе: исключение в DEBUG, тестах
+# и при QUERY_BUDGET_STRICT=True, иначе запись в лог с указанной долей.
+QUERY_BUDGET_STRICT: bool = (
+    DEBUG
+    or os.getenv('QUERY_BUDGET_STRICT', 'False') == 'True'
+    or sys.argv[1:2] == ['test']
+)
+QUERY_BUDGET_LOG_SAMPLE_RATE: float = float(
+    os.getenv('QUERY_BUDGET_LOG_SAMPLE_RATE', 0.1))
+
 ALLOWED_HOSTS = os.getenv('ALLOWED_HOSTS', '*').split(',')
 # ALLOWED_HOSTS = ['127.0.0.1']
 
@@ -52,11 +105,15 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'api.middleware.MetricsMiddleware',
+    'foodgram_backend.db_router.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.profiling.ProfilingMiddleware',
+    'api.budgets.QueryBudgetMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -92,6 +149,23 @@ DATABASES = {
     }
 }
 
+# Реплика для чтения подключается, если задан REPLICA_DB_HOST
+# или REPLICA_DB_NAME. Остальные параметры берутся из основной базы.
+# В тестах реплика - зеркало тестовой базы, а чтения в нее включают
+# только тесты маршрутизации.
+REPLICA_READS: bool = bool(
+    os.getenv('REPLICA_DB_HOST') or os.getenv('REPLICA_DB_NAME'))
+if REPLICA_READS or sys.argv[1:2] == ['test']:
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.getenv('REPLICA_DB_NAME', DATABASES['default']['NAME']),
+        'HOST': os.getenv('REPLICA_DB_HOST', DATABASES['default']['HOST']),
+        'PORT': os.getenv('REPLICA_DB_PORT', DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['foodgram_backend.db_router.ReplicaRouter']
+
 '''DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
@@ -119,6 +193,16 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
 LANGUAGE_CODE = 'en-us'
 
 TIME_ZONE = 'UTC'
@@ -135,12 +219,17 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Каталог для изображений, загружаемых по частям. Не должен быть
+# доступен снаружи, поэтому находится вне MEDIA_ROOT.
+IMAGE_UPLOAD_DIR = os.getenv(
+    'IMAGE_UPLOAD_DIR', os.path.join(BASE_DIR, 'uploads'))
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 AUTH_USER_MODEL = 'users.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
@@ -0,0 +1,119 @@
+from django.core.cache import cache
+from django.db import connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from recipes.models import Recipe
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from users.models import User
+
+from .db_router import PIN_COOKIE, REPLICA, ReplicaRouter, _use_replica
+
+
+@override_settings(REPLICA_READS=True)
+class ReplicaRoutingTest(TransactionTestCase):
+    """Чтения безопасных запросов к API идут в реплику, записи
+    и чтения после записи - в основную базу.
+    """
+    databases = {'default', REPLICA}
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass')
+        self.token = Token.objects.create(user=self.user)
+        self.recipe = Recipe.objects.create(
+            author=self.user, name='Рецепт', text='Описание',
+            cooking_time=10)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def request(self, client, method, url):
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections[REPLICA]) as replica:
+            response = getattr(client, method)(url)
+        self.assertLess(response.status_code, 400)
+        return response, primary, replica
+
+    def test_router(self):
+        router = ReplicaRouter()
+        token = _use_replica.set(True)
+        try:
+            self.assertEqual(router.db_for_read(Recipe), REPLICA)
+            self.assertIsNone(router.db_for_read(Token))
+            self.assertEqual(router.db_for_write(Recipe), 'default')
+        finally:
+            _use_replica.reset(token)
+        self.assertIsNone(router.db_for_read(Recipe))
+        self.assertFalse(router.allow_migrate(REPLICA, 'recipes'))
+
+    def test_safe_request_reads_replica(self):
+        _, primary, replica = self.request(
+            APIClient(), 'get', '/api/recipes/')
+        self.assertEqual(len(primary), 0)
+        self.assertGreater(len(replica), 0)
+        _, primary, replica = self.request(
+            self.client, 'get', '/api/recipes/')
+        self.assertGreater(len(replica), 0)
+        # Токен читается только из основной базы.
+        self.assertTrue(all(
+            'authtoken_token' in query['sql'] for query in primary))
+
+    def test_unsafe_request_uses_primary(self):
+        response, primary, replica = self.request(
+            self.client, 'post', f'/api/recipes/{self.recipe.id}/favorite/')
+        self.assertEqual(len(replica), 0)
+        self.assertGreater(len(primary), 0)
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+    def test_reads_after_write_use_primary(self):
+        self.client.post(f'/api/recipes/{self.recipe.id}/favorite/')
+        # Закрепление по токену: запрос без cookie.
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        response, primary, replica = self.request(
+            client, 'get', f'/api/recipes/{self.recipe.id}/')
+        self.assertEqual(len(replica), 0)
+        self.assertTrue(response.json()['is_favorited'])
+        # Закрепление по cookie: тот же клиент без токена.
+        self.client.credentials()
+        _, primary, replica = self.request(
+            self.client, 'get', '/api/recipes/')
+        self.assertEqual(len(replica), 0)
+        self.assertGreater(len(primary), 0)
+
+
+class CounterFieldsMixinTest(TestCase):
+    """Сохранение объекта не затирает счетчики и не загружает
+    отложенные поля.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='author', email='author@example.com', password='pass')
+        cls.recipe = Recipe.objects.create(
+            author=cls.user, name='Рецепт', text='Описание',
+            cooking_time=10)
+
+    def test_stale_counter_is_kept(self):
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        Recipe.objects.filter(pk=recipe.pk).update(favorites_count=3)
+        recipe.name = 'Новое название'
+        recipe.save()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.name, 'Новое название')
+        self.assertEqual(recipe.favorites_count, 3)
+
+    def test_deferred_fields_are_not_loaded(self):
+        for fields in (('name',), ('name', 'favorites_count')):
+            recipe = Recipe.objects.only(*fields).get(pk=self.recipe.pk)
+            Recipe.objects.filter(pk=recipe.pk).update(
+                favorites_count=5, text='Изменено')
+            recipe.name = 'Другое название'
+            with CaptureQueriesContext(connections['default']) as queries:
+                recipe.save()
+            self.assertEqual(len(queries), 1)
+            recipe.refresh_from_db()
+            self.assertEqual(recipe.favorites_count, 5)
+            self.assertEqual(recipe.text, 'Изменено')
@@ -1,13 +1,28 @@
+from collections import Counter
+
 from django.contrib import admin
+from django.db import transaction
+from users.admin_utils import (AuthorInputFilter, EstimatedCountPaginator,
+                               InputFilter, UserInputFilter)
 
 from .models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
                      ShoppingList, Tag)
+from .shopping_cart import (change_shopping_cart_totals, get_recipe_amounts,
+                            update_shopping_cart_totals)
 
 EMPTY_STRING: str = '-empty-'
 
 admin.site.site_header = 'Site administration Foodgram'
 
 
+class RecipeInputFilter(InputFilter):
+    """Фильтр по рецепту: id или начало названия."""
+    title = 'рецепту'
+    parameter_name = 'recipe'
+    id_field = 'recipe_id'
+    lookup_fields = ('recipe__name__istartswith',)
+
+
 class RecipeIngredientsAdmin(admin.StackedInline):
     model = IngredientInRecipe
     autocomplete_fields = ('ingredient',)
@@ -20,18 +35,34 @@ class RecipeAdmin(admin.ModelAdmin):
         'author',
         'name',
         'text',
-        'get_favorite_count'
+        'favorites_count'
     )
     list_editable = ('name',)
-    list_filter = ('author', 'name', 'tags',)
+    list_filter = (AuthorInputFilter, 'tags',)
+    list_select_related = ('author',)
+    autocomplete_fields = ('author',)
     search_fields = (
         'name',
-        'cooking_time',
         'author__username',
         'ingredients__name'
     )
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     empty_value_display = EMPTY_STRING
 
+    def save_related(self, request, form, formsets, change):
+        """Сохраняет ингредиенты и учитывает изменение состава
+        в суммах списков покупок.
+        """
+        recipe = form.instance
+        Recipe.objects.select_for_update().filter(pk=recipe.pk).exists()
+        before = get_recipe_amounts(recipe) if change else Counter()
+        super().save_related(request, form, formsets, change)
+        deltas = get_recipe_amounts(recipe)
+        deltas.subtract(before)
+        update_shopping_cart_totals(recipe, deltas)
+        recipe.update_search_vector()
+
     @admin.display(description='Электронная почта автора')
     def get_author(self, obj):
         return obj.author.email
@@ -52,11 +83,6 @@ class RecipeAdmin(admin.ModelAdmin):
             )
         ])
 
-    @admin.display(description='В избранном')
-    def get_favorite_count(self, obj):
-        """Подсчитывает сколько раз рецепт добавлен в избранное."""
-        return obj.favorites.count()
-
 
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
@@ -95,23 +121,53 @@ class IngredientAdmin(admin.ModelAdmin):
 
 @admin.register(Favorite)
 class FavoriteAdmin(admin.ModelAdmin):
-    ordering = ('user',)
+    list_display = (
+        'user',
+        'recipe'
+    )
+    list_select_related = ('user', 'recipe')
+    autocomplete_fields = ('user', 'recipe')
     search_fields = (
-        'recipe',
-        'user'
+        'recipe__name',
+        'user__username'
     )
-    list_filter = ('recipe',)
-    search_fields = ('recipe',)
+    list_filter = (RecipeInputFilter, UserInputFilter)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     empty_value_display = EMPTY_STRING
 
 
 @admin.register(ShoppingList)
 class ShoppingListAdmin(admin.ModelAdmin):
-    ordering = ('user',)
+    list_display = (
+        'user',
+        'recipe'
+    )
+    list_select_related = ('user', 'recipe')
+    autocomplete_fields = ('user', 'recipe')
     search_fields = (
-        'recipe',
-        'user'
+        'recipe__name',
+        'user__username'
     )
-    list_filter = ('recipe',)
-    search_fields = ('recipe',)
+    list_filter = (RecipeInputFilter, UserInputFilter)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     empty_value_display = EMPTY_STRING
+
+    def save_model(self, request, obj, form, change):
+        """Учитывает рецепт в суммах списка покупок пользователя."""
+        if change:
+            old = ShoppingList.objects.get(pk=obj.pk)
+            change_shopping_cart_totals(old.user_id, old.recipe_id, -1)
+        super().save_model(request, obj, form, change)
+        change_shopping_cart_totals(obj.user_id, obj.recipe_id, 1)
+
+    def delete_model(self, request, obj):
+        change_shopping_cart_totals(obj.user_id, obj.recipe_id, -1)
+        super().delete_model(request, obj)
+
+    @transaction.atomic
+    def delete_queryset(self, request, queryset):
+        for item in queryset:
+            change_shopping_cart_totals(item.user_id, item.recipe_id, -1)
+        super().delete_queryset(request, queryset)
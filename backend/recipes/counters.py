@@ -0,0 +1,36 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from users.models import Subscribe
+
+from .models import Favorite, Recipe, User
+
+# Счетчик: модель, поле и модель связи с внешним ключом на счетчик.
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'subscribers_count', Subscribe, 'author'),
+)
+
+
+def change_counter(model, pk, field, delta):
+    """Атомарно меняет счетчик, не опуская его ниже нуля."""
+    model.objects.filter(pk=pk).update(
+        **{field: Greatest(F(field) + delta, 0)})
+
+
+def get_live_count(related_model, related_field):
+    """Подзапрос с количеством связанных строк по исходной таблице."""
+    return Coalesce(Subquery(
+        related_model.objects.filter(
+            **{related_field: OuterRef('pk')}
+        ).order_by().values(related_field).annotate(
+            total=Count('pk')
+        ).values('total')
+    ), 0)
+
+
+def get_counter_mismatches(model, field, related_model, related_field):
+    """Строки, у которых счетчик разошелся с исходными данными."""
+    return model.objects.annotate(
+        live=get_live_count(related_model, related_field)
+    ).exclude(**{field: F('live')})
@@ -0,0 +1,111 @@
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image
+
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+# Вариант изображения: суффикс имени, максимальная сторона, расширение.
+VARIANTS = {
+    'small': ('small', 120, 'jpg'),
+    'small_webp': ('small', 120, 'webp'),
+    'medium': ('medium', 600, 'jpg'),
+    'medium_webp': ('medium', 600, 'webp'),
+}
+FORMATS = {'jpg': 'JPEG', 'webp': 'WEBP'}
+VARIANT_NAME_RE = re.compile(r'_(small|medium)\.(jpg|webp)$')
+
+_executor = ThreadPoolExecutor(max_workers=2)
+
+
+def get_variant_name(name, variant):
+    """Имя файла варианта рядом с исходным изображением."""
+    suffix, _, ext = VARIANTS[variant]
+    root, _ = os.path.splitext(name)
+    return f'{root}_{suffix}.{ext}'
+
+
+def is_variant_name(name):
+    return VARIANT_NAME_RE.search(name) is not None
+
+
+def generate_image_variants(name, force=False):
+    """Создает уменьшенные копии изображения в JPEG и WebP
+    и отмечает рецепты с этим изображением как имеющие копии.
+    """
+    variants = {
+        variant: get_variant_name(name, variant) for variant in VARIANTS
+    }
+    if not force:
+        variants = {
+            variant: variant_name
+            for variant, variant_name in variants.items()
+            if not default_storage.exists(variant_name)
+        }
+    if variants:
+        _save_variants(name, variants)
+    Recipe.objects.filter(image=name).exclude(
+        variants_image=name).update(variants_image=name)
+    return len(variants)
+
+
+def _save_variants(name, variants):
+    with default_storage.open(name) as file, Image.open(file) as image:
+        image.load()
+        for variant, variant_name in variants.items():
+            _, max_side, ext = VARIANTS[variant]
+            resized = image.copy()
+            resized.thumbnail((max_side, max_side))
+            if FORMATS[ext] == 'JPEG' and resized.mode != 'RGB':
+                resized = resized.convert('RGB')
+            content = BytesIO()
+            resized.save(content, FORMATS[ext], quality=85)
+            if default_storage.exists(variant_name):
+                default_storage.delete(variant_name)
+            default_storage.save(variant_name, ContentFile(content.getvalue()))
+
+
+def _generate_in_background(name):
+    try:
+        generate_image_variants(name)
+    except Exception:
+        logger.exception('Не удалось создать варианты изображения %s', name)
+
+
+def schedule_image_variants(name):
+    """Создает варианты изображения в фоне после фиксации транзакции."""
+    transaction.on_commit(
+        lambda: _executor.submit(_generate_in_background, name))
+
+
+def wait_for_image_variants():
+    """Дожидается фоновых задач и останавливает их пул.
+    Вызывается командами перед удалением файлов и завершением.
+    """
+    _executor.shutdown(wait=True)
+
+
+def delete_image(name):
+    """Удаляет изображение вместе с его уменьшенными копиями."""
+    for file_name in (name, *(
+            get_variant_name(name, variant) for variant in VARIANTS)):
+        if default_storage.exists(file_name):
+            default_storage.delete(file_name)
+
+
+def get_image_variant_url(image, variant):
+    """URL варианта изображения рецепта или исходника, если копии
+    еще не созданы. Наличие копий берется из поля variants_image,
+    без обращений к хранилищу.
+    """
+    if image.instance.variants_image != image.name:
+        return image.url
+    return image.storage.url(get_variant_name(image.name, variant))
@@ -0,0 +1,58 @@
+import os
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from recipes.images import VARIANT_NAME_RE
+from recipes.models import ImageUpload, Recipe
+
+
+class Command(BaseCommand):
+    help = ('Удаляет изображения, на которые не ссылается ни один рецепт, '
+            'и брошенные загрузки изображений')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=24,
+            help='Не трогать файлы моложе указанного числа часов.'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать файлы, которые будут удалены.'
+        )
+
+    def handle(self, *args, **options):
+        directory = Recipe._meta.get_field('image').upload_to
+        referenced = {
+            os.path.splitext(os.path.basename(name))[0]
+            for name in Recipe.objects.exclude(image='').exclude(
+                image__isnull=True).values_list('image', flat=True)
+        }
+        threshold = timezone.now() - timedelta(hours=options['min_age'])
+        _, files = default_storage.listdir(directory)
+        removed = 0
+        for filename in sorted(files):
+            root = VARIANT_NAME_RE.sub('', filename)
+            if os.path.splitext(root)[0] in referenced:
+                continue
+            name = directory + filename
+            if default_storage.get_modified_time(name) > threshold:
+                continue
+            removed += 1
+            if options['dry_run']:
+                self.stdout.write(name)
+            else:
+                default_storage.delete(name)
+        uploads = ImageUpload.objects.filter(created__lt=threshold)
+        for upload in uploads:
+            removed += 1
+            if options['dry_run']:
+                self.stdout.write(upload.path)
+            else:
+                upload.discard()
+        action = 'Будет удалено' if options['dry_run'] else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(f'{action} файлов: {removed}.'))
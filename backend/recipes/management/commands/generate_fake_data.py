@@ -0,0 +1,214 @@
+import io
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from PIL import Image
+from recipes.images import generate_image_variants
+from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
+                            ShoppingList, Tag)
+from users.models import Subscribe, User
+
+TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+)
+WORDS = (
+    'суп', 'салат', 'пирог', 'запеканка', 'каша', 'рагу', 'паста',
+    'домашний', 'быстрый', 'летний', 'острый', 'сытный', 'легкий',
+    'с грибами', 'с курицей', 'с овощами', 'по-деревенски', 'на скорую руку',
+)
+
+
+def zipf_weights(count, exponent):
+    """Веса для выбора с перекосом: первые элементы популярнее."""
+    return [1 / (rank ** exponent) for rank in range(1, count + 1)]
+
+
+class Command(BaseCommand):
+    help = ('Создает воспроизводимый синтетический набор данных '
+            'для нагрузочных замеров')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users', type=int, default=200,
+            help='Количество пользователей.'
+        )
+        parser.add_argument(
+            '--recipes', type=int, default=1000,
+            help='Количество рецептов.'
+        )
+        parser.add_argument(
+            '--favorites', type=int, default=20,
+            help='Среднее число рецептов в избранном у пользователя.'
+        )
+        parser.add_argument(
+            '--carts', type=int, default=5,
+            help='Среднее число рецептов в списке покупок.'
+        )
+        parser.add_argument(
+            '--subscriptions', type=int, default=10,
+            help='Среднее число подписок у пользователя.'
+        )
+        parser.add_argument(
+            '--skew', type=float, default=1.1,
+            help='Показатель степени распределения Ципфа для популярности.'
+        )
+        parser.add_argument(
+            '--seed', type=int, default=42,
+            help='Начальное значение генератора случайных чисел.'
+        )
+        parser.add_argument(
+            '--prefix', default='bench',
+            help='Префикс имен создаваемых пользователей.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Количество строк в одной вставке.'
+        )
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.options = options
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=prefix).exists():
+            raise CommandError(
+                f'Пользователи с префиксом {prefix} уже есть, '
+                'укажите другой --prefix.')
+        if not Ingredient.objects.exists():
+            call_command('load_ingredients', stdout=self.stdout)
+        with transaction.atomic():
+            tags = self.create_tags()
+            users = self.create_users()
+            recipes = self.create_recipes(users, tags)
+            self.create_relations(Favorite, users, recipes,
+                                  options['favorites'])
+            self.create_relations(ShoppingList, users, recipes,
+                                  options['carts'])
+            self.create_subscriptions(users)
+            Recipe.objects.filter(id__in=recipes).update(
+                search_vector=Recipe.get_search_vector())
+        call_command('reconcile_counters', stdout=self.stdout)
+        call_command('rebuild_shopping_cart_totals', stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано пользователей: {len(users)}, '
+            f'рецептов: {len(recipes)}.'))
+
+    def sample(self, population, weights, count, exclude=None):
+        """До count различных элементов с учетом весов."""
+        count = min(count, len(population) - (exclude is not None))
+        chosen = set()
+        while len(chosen) < count:
+            for item in self.random.choices(
+                    population, weights, k=count - len(chosen)):
+                if item != exclude:
+                    chosen.add(item)
+        return list(chosen)
+
+    def skewed_count(self, mean):
+        """Количество с длинным хвостом: у большинства мало, у немногих
+        много.
+        """
+        return int(self.random.expovariate(1 / mean)) if mean else 0
+
+    def create_tags(self):
+        if not Tag.objects.exists():
+            Tag.objects.bulk_create(
+                [Tag(name=name, color=color, slug=slug)
+                 for name, color, slug in TAGS])
+        return list(Tag.objects.order_by('id').values_list('id', flat=True))
+
+    def create_users(self):
+        prefix = self.options['prefix']
+        password = make_password(prefix)
+        User.objects.bulk_create(
+            [User(username=f'{prefix}{number}',
+                  email=f'{prefix}{number}@example.com',
+                  first_name='Имя',
+                  last_name='Фамилия',
+                  password=password)
+             for number in range(self.options['users'])],
+            batch_size=self.options['batch_size']
+        )
+        return list(User.objects.filter(
+            username__startswith=prefix
+        ).order_by('id').values_list('id', flat=True))
+
+    def create_image(self):
+        """Одно изображение на все рецепты; хранилище адресует файлы
+        по содержимому, поэтому повторные запуски его не дублируют.
+        """
+        field = Recipe._meta.get_field('image')
+        buffer = io.BytesIO()
+        Image.new('RGB', (600, 400), '#E26C2D').save(buffer, 'JPEG')
+        name = field.storage.save(
+            field.upload_to + 'bench.jpg', ContentFile(buffer.getvalue()))
+        generate_image_variants(name)
+        return name
+
+    def create_recipes(self, users, tags):
+        image = self.create_image()
+        ingredients = list(
+            Ingredient.objects.order_by('id').values_list('id', flat=True))
+        self.random.shuffle(ingredients)
+        ingredient_weights = zipf_weights(len(ingredients), 1)
+        author_weights = zipf_weights(len(users), self.options['skew'])
+        recipes = Recipe.objects.bulk_create(
+            [Recipe(author_id=author_id,
+                    name=' '.join(self.random.sample(WORDS, 3)).capitalize(),
+                    text=' '.join(self.random.choices(WORDS, k=30)),
+                    image=image,
+                    variants_image=image,
+                    cooking_time=self.random.randint(5, 180))
+             for author_id in self.random.choices(
+                 users, author_weights, k=self.options['recipes'])],
+            batch_size=self.options['batch_size']
+        )
+        recipe_ids = [recipe.id for recipe in recipes]
+        IngredientInRecipe.objects.bulk_create(
+            [IngredientInRecipe(recipe_id=recipe_id,
+                                ingredient_id=ingredient_id,
+                                amount=self.random.randint(1, 500))
+             for recipe_id in recipe_ids
+             for ingredient_id in self.sample(
+                 ingredients, ingredient_weights,
+                 max(1, min(20, round(self.random.gauss(8, 3)))))],
+            batch_size=self.options['batch_size']
+        )
+        RecipeTag = Recipe.tags.through
+        RecipeTag.objects.bulk_create(
+            [RecipeTag(recipe_id=recipe_id, tag_id=tag_id)
+             for recipe_id in recipe_ids
+             for tag_id in self.random.sample(
+                 tags, self.random.randint(1, len(tags)))],
+            batch_size=self.options['batch_size']
+        )
+        return recipe_ids
+
+    def create_relations(self, model, users, recipes, mean):
+        weights = zipf_weights(len(recipes), self.options['skew'])
+        model.objects.bulk_create(
+            [model(user_id=user_id, recipe_id=recipe_id)
+             for user_id in users
+             for recipe_id in self.sample(
+                 recipes, weights, self.skewed_count(mean))],
+            batch_size=self.options['batch_size'],
+            ignore_conflicts=True
+        )
+
+    def create_subscriptions(self, users):
+        weights = zipf_weights(len(users), self.options['skew'])
+        Subscribe.objects.bulk_create(
+            [Subscribe(user_id=user_id, author_id=author_id)
+             for user_id in users
+             for author_id in self.sample(
+                 users, weights,
+                 self.skewed_count(self.options['subscriptions']),
+                 exclude=user_id)],
+            batch_size=self.options['batch_size'],
+            ignore_conflicts=True
+        )
@@ -0,0 +1,31 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from recipes.images import generate_image_variants, is_variant_name
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Создает уменьшенные копии изображений рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Пересоздать уже существующие варианты.'
+        )
+
+    def handle(self, *args, **options):
+        directory = Recipe._meta.get_field('image').upload_to
+        _, files = default_storage.listdir(directory)
+        created = failed = 0
+        for filename in sorted(files):
+            if is_variant_name(filename):
+                continue
+            try:
+                created += generate_image_variants(
+                    directory + filename, force=options['force'])
+            except Exception as error:
+                failed += 1
+                self.stderr.write(f'{filename}: {error}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано вариантов: {created}, ошибок: {failed}.'))
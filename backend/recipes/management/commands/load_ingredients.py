@@ -1,22 +1,92 @@
 import csv
+import json
+from itertools import islice
+from pathlib import Path
 
-from django.core.management.base import BaseCommand
+from api.cache import invalidate_data_version
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 from recipes.models import Ingredient
 
 
 class Command(BaseCommand):
+    help = 'Загружает ингредиенты из CSV или JSON файла'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default=settings.BASE_DIR / 'data' / 'ingredients.csv',
+            type=Path,
+            help='Путь к файлу, по умолчанию data/ingredients.csv.'
+        )
+        parser.add_argument(
+            '--format',
+            choices=('csv', 'json'),
+            help='Формат файла, по умолчанию определяется по расширению.'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Количество строк в одной пачке.'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только посчитать изменения, не записывая их.'
+        )
 
     def handle(self, *args, **options):
-        self.import_ingredients()
-        print('Загрузка ингредиентов завершена.')
+        path = options['path']
+        file_format = options['format'] or path.suffix.lstrip('.').lower()
+        if file_format not in ('csv', 'json'):
+            raise CommandError(f'Неизвестный формат файла {path}.')
+        self.stdout.write(f'Загрузка данных из {path}')
+        existing = set(
+            Ingredient.objects.values_list('name', 'measurement_unit'))
+        created = skipped = 0
+        with path.open(newline='', encoding='utf-8') as file:
+            rows = getattr(self, f'read_{file_format}')(file)
+            with transaction.atomic():
+                while True:
+                    chunk = list(islice(rows, options['chunk_size']))
+                    if not chunk:
+                        break
+                    new = []
+                    for name, measurement_unit in chunk:
+                        if (name, measurement_unit) in existing:
+                            skipped += 1
+                            continue
+                        existing.add((name, measurement_unit))
+                        new.append(Ingredient(
+                            name=name, measurement_unit=measurement_unit))
+                    if not options['dry_run']:
+                        Ingredient.objects.bulk_create(
+                            new, ignore_conflicts=True)
+                    created += len(new)
+        if created and not options['dry_run']:
+            # Команда работает в своем процессе: сброс дойдет до
+            # веб-процессов только через общий кеш (CACHE_BACKEND).
+            # С LocMemCache по умолчанию они увидят новые данные
+            # по истечении REFERENCE_DATA_CACHE_TIMEOUT.
+            invalidate_data_version(Ingredient)
+        prefix = 'Пробный запуск: ' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix}новых ингредиентов {created}, '
+            f'уже существующих {skipped}.'
+        ))
+
+    @staticmethod
+    def read_csv(file):
+        for row in csv.reader(file):
+            if len(row) >= 2 and row[0].strip():
+                yield row[0].strip(), row[1].strip()
 
-    def import_ingredients(self, file='ingredients.csv'):
-        print(f'Загрузка данных из {file}')
-        path = f'./data/{file}'
-        with open(path, newline='', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            for row in reader:
-                Ingredient.objects.update_or_create(
-                    name=row[0],
-                    measurement_unit=row[1]
-                )
+    @staticmethod
+    def read_json(file):
+        for item in json.load(file):
+            if item.get('name', '').strip():
+                yield (item['name'].strip(),
+                       item.get('measurement_unit', '').strip())
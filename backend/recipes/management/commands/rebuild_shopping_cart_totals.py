@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from recipes.models import ShoppingCartTotal
+from recipes.shopping_cart import get_live_shopping_cart_totals
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает и проверяет суммы списков покупок'
+    batch_size = 1000
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только сравнить таблицу сумм с исходными данными.'
+        )
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            self.rebuild()
+        mismatches = self.compare()
+        if mismatches:
+            for user_id, ingredient_id, stored, live in mismatches[:20]:
+                self.stdout.write(
+                    f'user={user_id} ingredient={ingredient_id}: '
+                    f'в таблице {stored}, по данным {live}'
+                )
+            raise CommandError(
+                f'Расхождений в суммах списков покупок: {len(mismatches)}.')
+        self.stdout.write(self.style.SUCCESS(
+            'Суммы списков покупок совпадают с исходными данными.'))
+
+    def rebuild(self):
+        with transaction.atomic():
+            ShoppingCartTotal.objects.all().delete()
+            ShoppingCartTotal.objects.bulk_create(
+                (ShoppingCartTotal(
+                    user_id=user_id, ingredient_id=ingredient_id, amount=total)
+                 for user_id, ingredient_id, total
+                 in get_live_shopping_cart_totals().iterator()),
+                batch_size=self.batch_size
+            )
+        self.stdout.write(
+            f'Записано сумм: {ShoppingCartTotal.objects.count()}.')
+
+    def compare(self):
+        live = {
+            (user_id, ingredient_id): total
+            for user_id, ingredient_id, total
+            in get_live_shopping_cart_totals().iterator()
+        }
+        stored = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount
+            in ShoppingCartTotal.objects.filter(amount__gt=0).values_list(
+                'user_id', 'ingredient_id', 'amount').iterator()
+        }
+        return [
+            (*key, stored.get(key, 0), live.get(key, 0))
+            for key in sorted(live.keys() | stored.keys())
+            if stored.get(key, 0) != live.get(key, 0)
+        ]
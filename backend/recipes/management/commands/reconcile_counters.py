@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from recipes.counters import (COUNTERS, get_counter_mismatches,
+                              get_live_count)
+
+
+class Command(BaseCommand):
+    help = ('Сверяет счетчики избранного, рецептов и подписчиков '
+            'с исходными данными и исправляет расхождения')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только показать расхождения, ничего не исправляя.'
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        for model, field, related_model, related_field in COUNTERS:
+            mismatches = list(get_counter_mismatches(
+                model, field, related_model, related_field
+            ).values_list('pk', field, 'live'))
+            total += len(mismatches)
+            label = f'{model._meta.model_name}.{field}'
+            for pk, stored, live in mismatches[:20]:
+                self.stdout.write(
+                    f'{label} id={pk}: в поле {stored}, по данным {live}')
+            if mismatches and not options['check']:
+                model.objects.filter(
+                    pk__in=[pk for pk, _, _ in mismatches]
+                ).update(**{field: get_live_count(
+                    related_model, related_field)})
+                self.stdout.write(
+                    f'{label}: исправлено {len(mismatches)}.')
+        if total and options['check']:
+            raise CommandError(f'Расхождений в счетчиках: {total}.')
+        self.stdout.write(self.style.SUCCESS('Счетчики сверены.'))
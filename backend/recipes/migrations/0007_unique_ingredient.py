@@ -0,0 +1,21 @@
+# Generated by Django 3.2.25 on 2026-10-18 04:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """Ограничение добавляется отдельной миграцией: в PostgreSQL
+    ALTER TABLE нельзя выполнить в одной транзакции с изменениями
+    строк, у которых остались отложенные проверки внешних ключей.
+    """
+
+    dependencies = [
+        ('recipes', '0006_merge_duplicate_ingredients'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient'),
+        ),
+    ]
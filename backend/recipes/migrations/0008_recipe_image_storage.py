@@ -0,0 +1,19 @@
+# Generated by Django 3.2.25 on 2026-10-18 04:46
+
+from django.db import migrations, models
+import recipes.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_unique_ingredient'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=recipes.storage.ContentAddressedStorage(), upload_to='static/recipe/', verbose_name='Картинка'),
+        ),
+    ]
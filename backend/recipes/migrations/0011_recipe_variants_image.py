@@ -0,0 +1,38 @@
+# Generated by Django 3.2.25 on 2026-10-18 05:34
+
+import os
+
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+
+VARIANT_SUFFIXES = ('_small.jpg', '_small.webp', '_medium.jpg',
+                    '_medium.webp')
+
+
+def mark_existing_variants(apps, schema_editor):
+    """Отмечает рецепты, у изображений которых уже есть все копии."""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    names = Recipe.objects.exclude(image='').exclude(
+        image__isnull=True).values_list('image', flat=True).distinct()
+    for name in names:
+        root, _ = os.path.splitext(name)
+        if all(default_storage.exists(root + suffix)
+               for suffix in VARIANT_SUFFIXES):
+            Recipe.objects.filter(image=name).update(variants_image=name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='variants_image',
+            field=models.CharField(blank=True, editable=False, max_length=100, verbose_name='Картинка с готовыми уменьшенными копиями'),
+        ),
+        migrations.RunPython(
+            mark_existing_variants, migrations.RunPython.noop),
+    ]
@@ -1,13 +1,23 @@
+import os
+import uuid
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.core.validators import MinValueValidator
 from django.db import models
+from foodgram_backend.mixins import CounterFieldsMixin
 
+from .storage import ContentAddressedStorage
 from .validators import validate_color
 
 User = get_user_model()
 
 
 MAX_LEN = 256
+SEARCH_CONFIG = 'russian'
 
 
 class Ingredient(models.Model):
@@ -25,6 +35,12 @@ class Ingredient(models.Model):
         ordering = ['name']
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient'
+            )
+        ]
 
     def __str__(self):
         return f'{self.name}, {self.measurement_unit}.'
@@ -58,8 +74,10 @@ class Tag(models.Model):
         return self.name
 
 
-class Recipe(models.Model):
+class Recipe(CounterFieldsMixin, models.Model):
     """Модель рецептов."""
+    counter_fields = ('favorites_count',)
+
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -74,8 +92,15 @@ class Recipe(models.Model):
         blank=True,
         null=True,
         upload_to='static/recipe/',
+        storage=ContentAddressedStorage(),
         verbose_name='Картинка'
     )
+    variants_image = models.CharField(
+        max_length=100,
+        blank=True,
+        editable=False,
+        verbose_name='Картинка с готовыми уменьшенными копиями'
+    )
     text = models.TextField(
         verbose_name='Текстовое описание рецепта'
     )
@@ -101,15 +126,56 @@ class Recipe(models.Model):
         db_index=True,
         verbose_name='Дата публикации'
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество добавлений в избранное'
+    )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name='Поисковый вектор'
+    )
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
-        ordering = ('-pub_date',)
+        ordering = ('-pub_date', '-id')
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='recipe_pub_date_id_idx'
+            ),
+            GinIndex(
+                fields=['search_vector'],
+                name='recipe_search_vector_idx'
+            )
+        ]
 
     def __str__(self):
         return f'{self.author.email}, {self.name}'
 
+    @staticmethod
+    def get_search_vector():
+        """Поисковый вектор по названию, описанию и ингредиентам."""
+        ingredient_names = models.Subquery(
+            IngredientInRecipe.objects.filter(
+                recipe=models.OuterRef('pk')
+            ).order_by().values('recipe').annotate(
+                names=StringAgg('ingredient__name', ' ')
+            ).values('names')
+        )
+        return (
+            SearchVector('name', weight='A', config=SEARCH_CONFIG)
+            + SearchVector('text', weight='B', config=SEARCH_CONFIG)
+            + SearchVector(ingredient_names, weight='C', config=SEARCH_CONFIG)
+        )
+
+    def update_search_vector(self):
+        """Пересчитывает поисковый вектор рецепта."""
+        Recipe.objects.filter(pk=self.pk).update(
+            search_vector=self.get_search_vector())
+
 
 class IngredientInRecipe(models.Model):
     """Модель для привязки количества ингредиента к рецепту"""
@@ -201,3 +267,96 @@ class ShoppingList(RecipeUserList):
     def __str__(self):
         return (f'Пользователь {self.user} '
                 f'добавил {self.recipe.name} в покупки.')
+
+
+class ShoppingCartTotal(models.Model):
+    """Модель суммы ингредиента в списке покупок пользователя.
+    Поддерживается инкрементально при изменении списка покупок
+    и состава рецептов, чтобы выгрузка списка не пересчитывала суммы.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_cart_totals',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_cart_totals',
+        verbose_name='Ингредиент'
+    )
+    amount = models.IntegerField(
+        default=0,
+        verbose_name='Количество'
+    )
+
+    class Meta:
+        verbose_name = 'Сумма в списке покупок'
+        verbose_name_plural = 'Суммы в списках покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_cart_total'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user} - {self.ingredient} - {self.amount}'
+
+
+class ImageUpload(models.Model):
+    """Модель загрузки изображения по частям.
+    Полученные байты дописываются во временный файл, а после
+    завершения загрузки рецепт ссылается на нее по токену.
+    """
+    token = models.UUIDField(
+        default=uuid.uuid4,
+        unique=True,
+        editable=False,
+        verbose_name='Токен загрузки'
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='image_uploads',
+        verbose_name='Пользователь'
+    )
+    size = models.PositiveIntegerField(
+        verbose_name='Размер файла'
+    )
+    offset = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Получено байт'
+    )
+    extension = models.CharField(
+        max_length=10,
+        blank=True,
+        verbose_name='Расширение файла'
+    )
+    completed = models.BooleanField(
+        default=False,
+        verbose_name='Загрузка завершена'
+    )
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата создания'
+    )
+
+    class Meta:
+        verbose_name = 'Загрузка изображения'
+        verbose_name_plural = 'Загрузки изображений'
+        ordering = ['-id']
+
+    def __str__(self):
+        return f'{self.user} - {self.token}'
+
+    @property
+    def path(self):
+        return os.path.join(settings.IMAGE_UPLOAD_DIR, f'{self.token}.part')
+
+    def discard(self):
+        """Удаляет загрузку вместе с временным файлом."""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.delete()
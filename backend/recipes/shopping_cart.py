@@ -0,0 +1,83 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+
+from .models import (IngredientInRecipe, Recipe, ShoppingCartTotal,
+                     ShoppingList)
+
+
+def get_recipe_amounts(recipe):
+    """Количество каждого ингредиента в рецепте."""
+    return Counter(dict(
+        IngredientInRecipe.objects.filter(
+            recipe=recipe, ingredient__isnull=False
+        ).values_list('ingredient_id', 'amount')
+    ))
+
+
+def apply_shopping_cart_deltas(user_ids, deltas):
+    """Применяет изменения количеств к суммам списков покупок.
+    Отсутствующие строки создаются, значения меняются через F(),
+    обнуленные строки удаляются.
+    """
+    deltas = {
+        ingredient_id: delta
+        for ingredient_id, delta in deltas.items()
+        if ingredient_id is not None and delta
+    }
+    user_ids = list(user_ids)
+    if not user_ids or not deltas:
+        return
+    totals = ShoppingCartTotal.objects.filter(
+        user_id__in=user_ids, ingredient_id__in=deltas)
+    with transaction.atomic():
+        ShoppingCartTotal.objects.bulk_create(
+            [ShoppingCartTotal(user_id=user_id, ingredient_id=ingredient_id)
+             for user_id in user_ids for ingredient_id in deltas],
+            ignore_conflicts=True
+        )
+        totals.update(amount=F('amount') + Case(
+            *[When(ingredient_id=ingredient_id, then=Value(delta))
+              for ingredient_id, delta in deltas.items()],
+            default=Value(0),
+            output_field=IntegerField()
+        ))
+        totals.filter(amount__lte=0).delete()
+
+
+def update_shopping_cart_totals(recipe, deltas):
+    """Учитывает изменение состава рецепта у всех,
+    у кого он в списке покупок.
+    """
+    apply_shopping_cart_deltas(
+        ShoppingList.objects.filter(
+            recipe=recipe).values_list('user_id', flat=True),
+        deltas
+    )
+
+
+def change_shopping_cart_totals(user_id, recipe_id, sign):
+    """Прибавляет рецепт к сумме списка покупок пользователя
+    или вычитает его при sign=-1. Строка рецепта блокируется,
+    чтобы состав не поменялся во время пересчета.
+    """
+    with transaction.atomic():
+        Recipe.objects.select_for_update().filter(pk=recipe_id).exists()
+        apply_shopping_cart_deltas([user_id], {
+            ingredient_id: sign * amount
+            for ingredient_id, amount in get_recipe_amounts(recipe_id).items()
+        })
+
+
+def get_live_shopping_cart_totals():
+    """Суммы всех списков покупок, посчитанные по исходным таблицам."""
+    return IngredientInRecipe.objects.values(
+        'ingredient_id',
+        cart_user_id=F('recipe__shopping_cart__user_id')
+    ).filter(
+        ingredient__isnull=False,
+        cart_user_id__isnull=False
+    ).annotate(
+        total=Sum('amount')
+    ).order_by().values_list('cart_user_id', 'ingredient_id', 'total')
@@ -0,0 +1,36 @@
+from django.db.models.signals import post_save, pre_delete
+from django.dispatch import receiver
+
+from .images import schedule_image_variants
+from .models import Ingredient, Recipe
+from .shopping_cart import get_recipe_amounts, update_shopping_cart_totals
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_recipe_from_shopping_cart_totals(sender, instance, **kwargs):
+    """Вычитает удаляемый рецепт из сумм списков покупок."""
+    amounts = get_recipe_amounts(instance)
+    update_shopping_cart_totals(
+        instance,
+        {ingredient_id: -amount for ingredient_id, amount in amounts.items()}
+    )
+
+
+@receiver(post_save, sender=Ingredient)
+def update_recipes_search_vector(sender, instance, created, **kwargs):
+    """Обновляет поисковые векторы рецептов с переименованным
+    ингредиентом."""
+    if not created:
+        Recipe.objects.filter(ingredients=instance).update(
+            search_vector=Recipe.get_search_vector())
+
+
+@receiver(post_save, sender=Recipe)
+def create_image_variants(sender, instance, **kwargs):
+    """Запускает создание уменьшенных копий изображения рецепта.
+    Незагруженное изображение не менялось: копии для него уже запрошены.
+    """
+    if 'image' in instance.get_deferred_fields():
+        return
+    if instance.image:
+        schedule_image_variants(instance.image.name)
@@ -0,0 +1,53 @@
+import hashlib
+import os
+import tempfile
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, в котором имя файла - SHA-256 его содержимого.
+    Одинаковое изображение хранится один раз: если файл с таким
+    хешем уже есть, запись пропускается.
+    """
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        directory, filename = os.path.split(name)
+        ext = os.path.splitext(filename)[1].lower()
+        name = os.path.join(directory, digest.hexdigest() + ext)
+        return super().save(name, content, max_length)
+
+    def get_available_name(self, name, max_length=None):
+        """Имя определяется содержимым, поэтому не меняется."""
+        return name
+
+    def _save(self, name, content):
+        """Записывает файл, если его еще нет. У уже существующего файла
+        обновляется время изменения: сборщик мусора не удаляет файлы
+        моложе --min-age, и повторно использованный файл не пропадет
+        до сохранения ссылающегося на него рецепта.
+        """
+        full_path = self.path(name)
+        try:
+            os.utime(full_path)
+        except FileNotFoundError:
+            pass
+        else:
+            return name
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=directory, delete=False) as tmp:
+            for chunk in content.chunks():
+                tmp.write(chunk)
+        os.chmod(tmp.name, self.file_permissions_mode or 0o644)
+        os.replace(tmp.name, full_path)
+        return name
@@ -0,0 +1,140 @@
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase
+from users.models import User
+
+from .models import (Ingredient, IngredientInRecipe, Recipe,
+                     ShoppingCartTotal, ShoppingList, Tag)
+
+
+class MergeDuplicateIngredientsMigrationTest(TransactionTestCase):
+    """Миграции уникальности ингредиентов проходят на базе с дублями."""
+
+    migrate_from = [('recipes', '0005_recipe_pub_date_id_idx')]
+    migrate_to = [('recipes', '0007_unique_ingredient')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        self.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_duplicates_are_merged(self):
+        apps = self.migrate(self.migrate_from)
+        Ingredient = apps.get_model('recipes', 'Ingredient')
+        Recipe = apps.get_model('recipes', 'Recipe')
+        IngredientInRecipe = apps.get_model('recipes', 'IngredientInRecipe')
+        ShoppingCartTotal = apps.get_model('recipes', 'ShoppingCartTotal')
+        user = User.objects.create_user(
+            username='author', email='author@example.com', password='pass')
+        kept, first, second = Ingredient.objects.bulk_create([
+            Ingredient(name='Соль', measurement_unit='г') for _ in range(3)
+        ])
+        recipe = Recipe.objects.create(
+            author_id=user.id, name='Рецепт', text='Описание',
+            image='recipes/images/test.jpg', cooking_time=10)
+        other = Recipe.objects.create(
+            author_id=user.id, name='Другой рецепт', text='Описание',
+            image='recipes/images/test.jpg', cooking_time=10)
+        IngredientInRecipe.objects.bulk_create([
+            IngredientInRecipe(recipe=recipe, ingredient=kept, amount=5),
+            IngredientInRecipe(recipe=recipe, ingredient=first, amount=3),
+            IngredientInRecipe(recipe=other, ingredient=second, amount=2),
+        ])
+        ShoppingCartTotal.objects.bulk_create([
+            ShoppingCartTotal(user_id=user.id, ingredient=first, amount=3),
+            ShoppingCartTotal(user_id=user.id, ingredient=second, amount=2),
+        ])
+
+        apps = self.migrate(self.migrate_to)
+        Ingredient = apps.get_model('recipes', 'Ingredient')
+        IngredientInRecipe = apps.get_model('recipes', 'IngredientInRecipe')
+        ShoppingCartTotal = apps.get_model('recipes', 'ShoppingCartTotal')
+        self.assertEqual(
+            list(Ingredient.objects.values_list('id', flat=True)), [kept.id])
+        self.assertEqual(
+            dict(IngredientInRecipe.objects.values_list(
+                'recipe_id', 'amount')),
+            {recipe.id: 8, other.id: 2})
+        self.assertEqual(
+            list(ShoppingCartTotal.objects.values_list(
+                'ingredient_id', 'amount')),
+            [(kept.id, 5)])
+
+
+class AdminShoppingCartTotalsTest(TestCase):
+    """Изменения в админке учитываются в суммах списков покупок."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass')
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass')
+        cls.tag = Tag.objects.create(
+            name='Завтрак', color='#E26C2D', slug='breakfast')
+        cls.salt, cls.pepper = Ingredient.objects.bulk_create([
+            Ingredient(name='Соль', measurement_unit='г'),
+            Ingredient(name='Перец', measurement_unit='г'),
+        ])
+        cls.recipe = Recipe.objects.create(
+            author=cls.admin, name='Рецепт', text='Описание',
+            image='recipes/images/test.jpg', cooking_time=10)
+        cls.recipe.tags.set([cls.tag])
+        cls.amount = IngredientInRecipe.objects.create(
+            recipe=cls.recipe, ingredient=cls.salt, amount=5)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def get_totals(self):
+        return dict(ShoppingCartTotal.objects.filter(
+            user=self.user).values_list('ingredient_id', 'amount'))
+
+    def add_to_cart(self):
+        response = self.client.post('/admin/recipes/shoppinglist/add/', {
+            'user': self.user.id, 'recipe': self.recipe.id})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.get_totals(), {self.salt.id: 5})
+        return ShoppingList.objects.get()
+
+    def test_shopping_list_add_and_delete(self):
+        item = self.add_to_cart()
+        self.client.post(
+            f'/admin/recipes/shoppinglist/{item.id}/delete/', {'post': 'yes'})
+        self.assertEqual(self.get_totals(), {})
+        item = self.add_to_cart()
+        self.client.post('/admin/recipes/shoppinglist/', {
+            'action': 'delete_selected', '_selected_action': [item.id],
+            'post': 'yes'})
+        self.assertFalse(ShoppingList.objects.exists())
+        self.assertEqual(self.get_totals(), {})
+
+    def test_recipe_ingredients_change(self):
+        self.add_to_cart()
+        response = self.client.post(
+            f'/admin/recipes/recipe/{self.recipe.id}/change/', {
+                'author': self.admin.id,
+                'name': self.recipe.name,
+                'text': self.recipe.text,
+                'cooking_time': self.recipe.cooking_time,
+                'tags': [self.tag.id],
+                'ingredient_in_recipe-TOTAL_FORMS': 2,
+                'ingredient_in_recipe-INITIAL_FORMS': 1,
+                'ingredient_in_recipe-MIN_NUM_FORMS': 0,
+                'ingredient_in_recipe-MAX_NUM_FORMS': 1000,
+                'ingredient_in_recipe-0-id': self.amount.id,
+                'ingredient_in_recipe-0-recipe': self.recipe.id,
+                'ingredient_in_recipe-0-ingredient': self.salt.id,
+                'ingredient_in_recipe-0-amount': 8,
+                'ingredient_in_recipe-1-recipe': self.recipe.id,
+                'ingredient_in_recipe-1-ingredient': self.pepper.id,
+                'ingredient_in_recipe-1-amount': 2,
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            self.get_totals(), {self.salt.id: 8, self.pepper.id: 2})
@@ -0,0 +1,196 @@
+"""Добавление и удаление избранного, списка покупок и подписок.
+Каждое действие - один SQL-запрос с CTE: проверка существования
+рецепта или автора, вставка ON CONFLICT DO NOTHING или DELETE RETURNING
+и обновление счетчиков и сумм списка покупок. Повторный или
+одновременный запрос не нарушает уникальность, а результат
+определяется по возвращенным строкам.
+Изменение списка покупок сначала берет разделяемую блокировку строки
+рецепта, как RecipeSerializer.update берет исключительную: иначе суммы
+посчитались бы по старому составу рецепта.
+"""
+from django.db import connection, transaction
+from django.utils import timezone
+from users.models import Subscribe
+
+from .models import (Favorite, IngredientInRecipe, Recipe, ShoppingCartTotal,
+                     ShoppingList, User)
+
+TABLES = {
+    'recipe': Recipe._meta.db_table,
+    'favorite': Favorite._meta.db_table,
+    'cart': ShoppingList._meta.db_table,
+    'amount': IngredientInRecipe._meta.db_table,
+    'total': ShoppingCartTotal._meta.db_table,
+    'user': User._meta.db_table,
+    'subscribe': Subscribe._meta.db_table,
+}
+
+RECIPE_FIELDS = ('id', 'name', 'image', 'variants_image', 'cooking_time')
+AUTHOR_FIELDS = ('id', 'email', 'username', 'first_name', 'last_name',
+                 'recipes_count')
+
+ADD_FAVORITE_SQL = '''
+WITH recipe AS (
+    SELECT id, name, image, variants_image, cooking_time FROM {recipe}
+    WHERE id = %(recipe)s
+), inserted AS (
+    INSERT INTO {favorite} (user_id, recipe_id)
+    SELECT %(user)s, id FROM recipe
+    ON CONFLICT DO NOTHING
+    RETURNING recipe_id
+), counted AS (
+    UPDATE {recipe} SET favorites_count = favorites_count + 1
+    WHERE id IN (SELECT recipe_id FROM inserted)
+)
+SELECT recipe.*, EXISTS (SELECT 1 FROM inserted) FROM recipe
+'''.format(**TABLES)
+
+REMOVE_FAVORITE_SQL = '''
+WITH deleted AS (
+    DELETE FROM {favorite}
+    WHERE user_id = %(user)s AND recipe_id = %(recipe)s
+    RETURNING recipe_id
+), counted AS (
+    UPDATE {recipe} SET favorites_count = GREATEST(favorites_count - 1, 0)
+    WHERE id IN (SELECT recipe_id FROM deleted)
+)
+SELECT EXISTS (SELECT 1 FROM {recipe} WHERE id = %(recipe)s),
+       EXISTS (SELECT 1 FROM deleted)
+'''.format(**TABLES)
+
+LOCK_RECIPE_SQL = '''
+SELECT 1 FROM {recipe} WHERE id = %(recipe)s FOR SHARE
+'''.format(**TABLES)
+
+ADD_TO_CART_SQL = '''
+WITH recipe AS (
+    SELECT id, name, image, variants_image, cooking_time FROM {recipe}
+    WHERE id = %(recipe)s
+), inserted AS (
+    INSERT INTO {cart} (user_id, recipe_id)
+    SELECT %(user)s, id FROM recipe
+    ON CONFLICT DO NOTHING
+    RETURNING recipe_id
+), totals AS (
+    INSERT INTO {total} (user_id, ingredient_id, amount)
+    SELECT %(user)s, ingredient_id, SUM(amount) FROM {amount}
+    WHERE recipe_id IN (SELECT recipe_id FROM inserted)
+        AND ingredient_id IS NOT NULL
+    GROUP BY ingredient_id
+    ON CONFLICT (user_id, ingredient_id)
+    DO UPDATE SET amount = {total}.amount + EXCLUDED.amount
+)
+SELECT recipe.*, EXISTS (SELECT 1 FROM inserted) FROM recipe
+'''.format(**TABLES)
+
+REMOVE_FROM_CART_SQL = '''
+WITH deleted AS (
+    DELETE FROM {cart}
+    WHERE user_id = %(user)s AND recipe_id = %(recipe)s
+    RETURNING recipe_id
+), amounts AS (
+    SELECT ingredient_id, SUM(amount) AS amount FROM {amount}
+    WHERE recipe_id IN (SELECT recipe_id FROM deleted)
+        AND ingredient_id IS NOT NULL
+    GROUP BY ingredient_id
+), decreased AS (
+    UPDATE {total} SET amount = {total}.amount - amounts.amount
+    FROM amounts
+    WHERE {total}.user_id = %(user)s
+        AND {total}.ingredient_id = amounts.ingredient_id
+        AND {total}.amount > amounts.amount
+), removed AS (
+    DELETE FROM {total} USING amounts
+    WHERE {total}.user_id = %(user)s
+        AND {total}.ingredient_id = amounts.ingredient_id
+        AND {total}.amount <= amounts.amount
+)
+SELECT EXISTS (SELECT 1 FROM {recipe} WHERE id = %(recipe)s),
+       EXISTS (SELECT 1 FROM deleted)
+'''.format(**TABLES)
+
+SUBSCRIBE_SQL = '''
+WITH author AS (
+    SELECT id, email, username, first_name, last_name, recipes_count
+    FROM {user} WHERE id = %(author)s
+), inserted AS (
+    INSERT INTO {subscribe} (user_id, author_id, created)
+    SELECT %(user)s, id, %(now)s FROM author
+    ON CONFLICT DO NOTHING
+    RETURNING author_id
+), counted AS (
+    UPDATE {user} SET subscribers_count = subscribers_count + 1
+    WHERE id IN (SELECT author_id FROM inserted)
+)
+SELECT author.*, EXISTS (SELECT 1 FROM inserted) FROM author
+'''.format(**TABLES)
+
+UNSUBSCRIBE_SQL = '''
+WITH deleted AS (
+    DELETE FROM {subscribe}
+    WHERE user_id = %(user)s AND author_id = %(author)s
+    RETURNING author_id
+), counted AS (
+    UPDATE {user} SET subscribers_count = GREATEST(subscribers_count - 1, 0)
+    WHERE id IN (SELECT author_id FROM deleted)
+)
+SELECT EXISTS (SELECT 1 FROM {user} WHERE id = %(author)s),
+       EXISTS (SELECT 1 FROM deleted)
+'''.format(**TABLES)
+
+
+def fetch_one(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchone()
+
+
+def add_object(model, fields, sql, params):
+    """Выполняет вставку и возвращает объект из запроса (или None,
+    если его нет) и признак того, что строка была добавлена.
+    """
+    row = fetch_one(sql, params)
+    if row is None:
+        return None, False
+    *values, created = row
+    return model(**dict(zip(fields, values))), created
+
+
+def add_favorite(user, recipe_id):
+    return add_object(Recipe, RECIPE_FIELDS, ADD_FAVORITE_SQL,
+                      {'user': user.id, 'recipe': recipe_id})
+
+
+def remove_favorite(user, recipe_id):
+    """Возвращает признаки существования рецепта и удаления строки."""
+    return fetch_one(REMOVE_FAVORITE_SQL,
+                     {'user': user.id, 'recipe': recipe_id})
+
+
+def add_to_shopping_cart(user, recipe_id):
+    params = {'user': user.id, 'recipe': recipe_id}
+    with transaction.atomic():
+        if fetch_one(LOCK_RECIPE_SQL, params) is None:
+            return None, False
+        return add_object(Recipe, RECIPE_FIELDS, ADD_TO_CART_SQL, params)
+
+
+def remove_from_shopping_cart(user, recipe_id):
+    """Возвращает признаки существования рецепта и удаления строки."""
+    params = {'user': user.id, 'recipe': recipe_id}
+    with transaction.atomic():
+        if fetch_one(LOCK_RECIPE_SQL, params) is None:
+            return False, False
+        return fetch_one(REMOVE_FROM_CART_SQL, params)
+
+
+def subscribe(user, author_id):
+    return add_object(
+        User, AUTHOR_FIELDS, SUBSCRIBE_SQL,
+        {'user': user.id, 'author': author_id, 'now': timezone.now()})
+
+
+def unsubscribe(user, author_id):
+    """Возвращает признаки существования автора и удаления подписки."""
+    return fetch_one(UNSUBSCRIBE_SQL,
+                     {'user': user.id, 'author': author_id})
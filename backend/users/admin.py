@@ -1,5 +1,7 @@
 from django.contrib import admin
 
+from .admin_utils import (AuthorInputFilter, EstimatedCountPaginator,
+                          UserInputFilter)
 from .models import Subscribe, User
 
 EMPTY_STRING: str = '-empty-'
@@ -13,7 +15,9 @@ class MyUserAdmin(admin.ModelAdmin):
         'username',
         'first_name',
         'last_name',
-        'email'
+        'email',
+        'recipes_count',
+        'subscribers_count'
     )
     search_fields = (
         'email',
@@ -22,10 +26,8 @@ class MyUserAdmin(admin.ModelAdmin):
         'last_name'
     )
     list_editable = ('email',)
-    list_filter = (
-        'email',
-        'username'
-    )
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     empty_value_display = EMPTY_STRING
 
 
@@ -40,5 +42,9 @@ class SubscribeAdmin(admin.ModelAdmin):
         'user__email',
         'author__email'
     )
-    list_filter = ('user', 'author')
+    list_filter = (UserInputFilter, AuthorInputFilter)
+    list_select_related = ('user', 'author')
+    autocomplete_fields = ('user', 'author')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     empty_value_display = EMPTY_STRING
@@ -0,0 +1,86 @@
+from django.conf import settings
+from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+def get_estimated_count(model):
+    """Оценка числа строк таблицы из статистики PostgreSQL.
+    Возвращает None, если таблица еще не анализировалась.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples::bigint FROM pg_class '
+            'WHERE oid = %s::regclass',
+            [model._meta.db_table]
+        )
+        row = cursor.fetchone()
+    if row is None or row[0] < 0:
+        return None
+    return row[0]
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор админки для больших таблиц.
+    Без фильтров берет оценку числа строк вместо COUNT(*),
+    если таблица больше ADMIN_ESTIMATED_COUNT_THRESHOLD.
+    """
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where:
+            estimate = get_estimated_count(self.object_list.model)
+            if (estimate is not None
+                    and estimate > settings.ADMIN_ESTIMATED_COUNT_THRESHOLD):
+                return estimate
+        return super().count
+
+
+class InputFilter(admin.SimpleListFilter):
+    """Фильтр с полем ввода вместо списка всех значений.
+    Значение ищется по lookup_fields, число сравнивается с id.
+    """
+    template = 'admin/input_filter.html'
+    id_field = None
+    lookup_fields = ()
+
+    def lookups(self, request, model_admin):
+        return ((None, None),)
+
+    def choices(self, changelist):
+        all_choice = next(super().choices(changelist))
+        all_choice['query_parts'] = (
+            (key, value)
+            for key, value in changelist.params.items()
+            if key != self.parameter_name
+        )
+        yield all_choice
+
+    def queryset(self, request, queryset):
+        value = (self.value() or '').strip()
+        if not value:
+            return queryset
+        if value.isdigit() and self.id_field:
+            return queryset.filter(**{self.id_field: int(value)})
+        condition = Q()
+        for field in self.lookup_fields:
+            condition |= Q(**{field: value})
+        return queryset.filter(condition)
+
+
+class UserInputFilter(InputFilter):
+    """Фильтр по пользователю: id, username или email."""
+    title = 'пользователю'
+    parameter_name = 'user'
+    id_field = 'user_id'
+    lookup_fields = ('user__username', 'user__email')
+
+
+class AuthorInputFilter(InputFilter):
+    """Фильтр по автору: id, username или email."""
+    title = 'автору'
+    parameter_name = 'author'
+    id_field = 'author_id'
+    lookup_fields = ('author__username', 'author__email')
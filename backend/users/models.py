@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from foodgram_backend.mixins import CounterFieldsMixin
 
 from .validators import validate_username
 
@@ -7,9 +8,10 @@ USER = 'user'
 ADMIN = 'admin'
 
 
-class User(AbstractUser):
+class User(CounterFieldsMixin, AbstractUser):
     """Полнофункциональная модель пользователя."""
     ROLES = ((USER, USER), (ADMIN, ADMIN))
+    counter_fields = ('recipes_count', 'subscribers_count')
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
 
@@ -37,6 +39,16 @@ class User(AbstractUser):
         verbose_name='Фамилия',
         help_text='Введите фамилию'
     )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество рецептов'
+    )
+    subscribers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество подписчиков'
+    )
 
     class Meta:
         ordering = ('username',)
@@ -46,6 +58,17 @@ class User(AbstractUser):
     def __str__(self):
         return f'@{self.username}: {self.email}.'
 
+    def refresh_from_db(self, using=None, fields=None):
+        """При обращении к отложенному полю загружает все отложенные
+        поля одним запросом, а не по запросу на каждое.
+        """
+        if fields is not None:
+            fields = set(fields)
+            deferred_fields = self.get_deferred_fields()
+            if fields & deferred_fields:
+                fields |= deferred_fields
+        super().refresh_from_db(using, fields)
+
     @property
     def is_admin(self):
         return self.is_staff or self.is_superuser
@@ -67,6 +90,7 @@ class Subscribe(models.Model):
         User,
         on_delete=models.CASCADE,
         related_name='subscribing',
+        db_index=False,
         verbose_name='Автор рецепта'
     )
     created = models.DateTimeField(
@@ -77,6 +101,14 @@ class Subscribe(models.Model):
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
         ordering = ['-id']
+        # Уникальный индекс (user, author) ищет подписки пользователя,
+        # индекс (author, user) - подписчиков автора.
+        indexes = [
+            models.Index(
+                fields=['author', 'user'],
+                name='subscribe_author_user_idx'
+            ),
+        ]
         constraints = [
             models.UniqueConstraint(
                 fields=['user', 'author'],